@@ -0,0 +1,78 @@
+"""
+compare the speed of the error statistics with and without the numba kernels
+
+    $ python benchmarks/bench_kernels.py --size 50000000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# run from the source tree without installing
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bsmcmp import kernels
+from bsmcmp.stats import ErrorStat
+
+
+def run(func, repeat):
+    # the best of "repeat" runs
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def error_stat(a, b):
+    stat = ErrorStat(a.shape)
+    stat.update(a, b)
+    return stat
+
+
+def bench(dtype, size, n_mismatch, repeat):
+    rng = np.random.default_rng(0)
+    a = rng.random(size).astype(dtype)
+    b = a.copy()
+    if n_mismatch:
+        b[rng.choice(size, n_mismatch, replace=False)] += 1
+
+    results = {}
+    for name, enabled in [('numpy', False), ('numba', True)]:
+        kernels.ENABLED = enabled
+        if enabled:
+            # compile
+            kernels.array_equal(a, b)
+            error_stat(a, b)
+        results[name] = (run(lambda: kernels.array_equal(a, b), repeat),
+                         run(lambda: error_stat(a, b), repeat),
+                         error_stat(a, b))
+
+    s1, s2 = results['numpy'][2], results['numba'][2]
+    assert s1.n_mismatch == s2.n_mismatch and s1.n_zero == s2.n_zero
+    assert np.isclose(s1.err.max, s2.err.max) and np.isclose(s1.err.avg, s2.err.avg)
+    for i, task in enumerate(['array_equal', 'ErrorStat']):
+        t1, t2 = results['numpy'][i], results['numba'][i]
+        print(f'{np.dtype(dtype).name:>8} {n_mismatch:>10} {task:>12} '
+              f'{t1*1000:10.1f} {t2*1000:10.1f} {t1/t2:8.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=20000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    impl = kernels.load()
+    if impl is None:
+        print('numba is not installed (or BSMCMP_NUMBA=0)')
+        return
+    print(f'size: {args.size}, threads: {impl.numba.get_num_threads()}')
+    print(f'{"dtype":>8} {"mismatch":>10} {"task":>12} {"numpy(ms)":>10} {"numba(ms)":>10} {"speedup":>9}')
+    for dtype in [np.float32, np.float64]:
+        for n_mismatch in [0, 100]:
+            bench(dtype, args.size, n_mismatch, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
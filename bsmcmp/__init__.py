@@ -1 +1,9 @@
 from .version import __version__
+
+def __getattr__(name):
+    # import the API lazily, so importing the package (e.g., to get the
+    # version when building) doesn't need the dependencies
+    if name in ('compare_files', 'compare_arrays'):
+        from . import api
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
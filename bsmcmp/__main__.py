@@ -2,10 +2,47 @@ import click
 from auto_click_auto import enable_click_shell_completion
 from auto_click_auto.utils import detect_shell
 
+import importlib
 from .version import __version__, PROJECT_NAME
-from .ascii import test_ascii
 
-@click.group()
+# command -> (module, function); the module is imported when the command is
+# used, so e.g., "submit" doesn't load the format modules (netCDF4, h5py, ...)
+COMMANDS = {
+    'ascii': ('ascii', 'test_ascii'),
+    'csv': ('csv', 'test_csv'),
+    'fingerprint': ('fingerprint', 'test_fingerprint'),
+    'geotiff': ('geotiff', 'test_geotiff'),
+    'grib': ('grib2', 'test_grib2'),
+    'hdf5': ('h5', 'test_h5'),
+    'matlab': ('mat', 'test_mat'),
+    'merge': ('merge', 'merge_result'),
+    'netcdf': ('netcdf', 'test_netcdf'),
+    'serve': ('serve', 'serve'),
+    'submit': ('serve', 'submit'),
+    'zarr': ('zarr2', 'test_zarr'),
+}
+
+
+class LazyGroup(click.Group):
+    def list_commands(self, ctx):
+        # the commands whose module fails to import (e.g., the dependency
+        # is not installed) are not listed
+        return sorted(set(super().list_commands(ctx)) |
+                      {k for k in COMMANDS if self.get_command(ctx, k) is not None})
+
+    def get_command(self, ctx, name):
+        cmd = super().get_command(ctx, name)
+        if cmd is None and name in COMMANDS:
+            module, func = COMMANDS[name]
+            try:
+                cmd = getattr(importlib.import_module(f'.{module}', __package__ or 'bsmcmp'), func)
+            except:
+                return None
+            self.add_command(cmd, name)
+        return cmd
+
+
+@click.group(cls=LazyGroup)
 @click.version_option(__version__)
 def cli():
     pass
@@ -22,43 +59,5 @@ try:
 except:
     pass
 
-cli.add_command(test_ascii)
-try:
-    from .netcdf import test_netcdf
-    cli.add_command(test_netcdf)
-except:
-    pass
-
-try:
-    from .h5 import test_h5
-    cli.add_command(test_h5)
-except:
-    pass
-
-try:
-    from .grib2 import test_grib2
-    cli.add_command(test_grib2)
-except:
-    pass
-
-try:
-    from .mat import test_mat
-    cli.add_command(test_mat)
-except:
-    pass
-
-try:
-    from .csv import test_csv
-    cli.add_command(test_csv)
-except:
-    pass
-
-try:
-    from .geotiff import test_geotiff
-    cli.add_command(test_geotiff)
-except:
-    pass
-
-
 if __name__ == '__main__':
     cli()
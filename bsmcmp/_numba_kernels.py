@@ -0,0 +1,54 @@
+# the numba kernels, only imported by kernels.py when they are used
+import numpy as np
+import numba
+
+
+def n_blocks(size):
+    return max(1, min(numba.get_num_threads()*4, size))
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def array_equal(a, b, n_blocks):
+    step = (a.size + n_blocks - 1) // n_blocks
+    equal = np.ones(n_blocks, dtype=np.bool_)
+    for k in numba.prange(n_blocks):
+        for i in range(k*step, min(a.size, (k + 1)*step)):
+            # nan == nan
+            if a[i] != b[i] and not (a[i] != a[i] and b[i] != b[i]):
+                equal[k] = False
+                break
+    return equal.all()
+
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def error_stats(a, b, n_blocks):
+    # the statistics of each block in one pass (Welford), merged by the caller
+    step = (a.size + n_blocks - 1) // n_blocks
+    counts = np.zeros((n_blocks, 4), dtype=np.int64)
+    stats = np.zeros((n_blocks, 4), dtype=np.float64)
+    for k in numba.prange(n_blocks):
+        n_mismatch = n = n_zero = n_nan = 0
+        mean = m2 = 0.0
+        vmin, vmax = np.inf, -np.inf
+        for i in range(k*step, min(a.size, (k + 1)*step)):
+            x, y = a[i], b[i]
+            if x != y and not (x != x and y != y):
+                n_mismatch += 1
+            # in float64, so no overflow of the (unsigned) integers
+            e = abs(np.float64(x) - np.float64(y))
+            if e != e:
+                n_nan += 1
+                continue
+            n += 1
+            d = e - mean
+            mean += d / n
+            m2 += d*(e - mean)
+            if e == 0:
+                n_zero += 1
+            if e < vmin:
+                vmin = e
+            if e > vmax:
+                vmax = e
+        counts[k, 0], counts[k, 1], counts[k, 2], counts[k, 3] = n_mismatch, n, n_zero, n_nan
+        stats[k, 0], stats[k, 1], stats[k, 2], stats[k, 3] = mean, m2, vmin, vmax
+    return counts, stats
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+def join(c1, c2):
+    # the indices (i1, i2) of the same coordinate values in c1 and c2, in the
+    # order of c1; the values are matched by sorting both (intersect1d), so
+    # a reversed axis or a subset is matched as well
+    c1 = np.asarray(c1).ravel()
+    c2 = np.asarray(c2).ravel()
+    if np.array_equal(c1, c2):
+        i = np.arange(len(c1))
+        return i, i
+    _, i1, i2 = np.intersect1d(c1, c2, return_indices=True)
+    order = np.argsort(i1, kind='stable')
+    return i1[order], i2[order]
+
+
+def to_slice(idx):
+    # the slice of the evenly spaced indices, otherwise the indices
+    if len(idx) == 0:
+        return slice(0, 0)
+    step = int(idx[1] - idx[0]) if len(idx) > 1 else 1
+    if step != 0 and np.all(np.diff(idx) == step):
+        stop = int(idx[-1]) + step
+        return slice(int(idx[0]), stop if stop >= 0 else None, step)
+    return idx
+
+
+def is_identity(idx, n):
+    return len(idx) == n and (n == 0 or (idx[0] == 0 and to_slice(idx) == slice(0, n, 1)))
+
+
+class Alignment:
+    # how the variable of file2 is aligned to the one of file1: perm[k] is
+    # the axis of file2 for the axis k of file1, and idx1[k]/idx2[k] the
+    # indices of the overlapping region along the axis k of file1
+    def __init__(self, dims, perm, idx1, idx2):
+        self.dims = tuple(dims)
+        self.perm = tuple(perm)
+        self.idx1 = idx1
+        self.idx2 = idx2
+
+    @classmethod
+    def create(cls, dims1, dims2, coords1, coords2):
+        # None if the variables don't have the same dimensions
+        dims1, dims2 = tuple(dims1), tuple(dims2)
+        if len(dims1) != len(dims2) or len(set(dims1)) != len(dims1) or set(dims1) != set(dims2):
+            return None
+        perm = tuple(dims2.index(k) for k in dims1)
+        idx1, idx2 = [], []
+        for k, c1 in enumerate(coords1):
+            i1, i2 = join(c1, coords2[perm[k]])
+            idx1.append(i1)
+            idx2.append(i2)
+        return cls(dims1, perm, idx1, idx2)
+
+    @property
+    def shape(self):
+        # the shape of the overlapping region
+        return tuple(len(i) for i in self.idx1)
+
+    def is_identity(self, shape1, shape2):
+        # whether the variables are already aligned element by element
+        return self.perm == tuple(range(len(self.perm))) and tuple(shape1) == tuple(shape2) and \
+               all(is_identity(i1, n) and is_identity(i2, n)
+                   for i1, i2, n in zip(self.idx1, self.idx2, shape1))
+
+    def rows(self, start, stop):
+        # the indices (along the axis of file1/file2) of the rows [start, stop)
+        # of the overlapping region, one block for each side
+        sel1 = [self.idx1[0][start:stop]] + self.idx1[1:]
+        sel2 = [self.idx2[0][start:stop]] + self.idx2[1:]
+        # in the axis order of file2
+        order = np.argsort(self.perm)
+        return sel1, [sel2[k] for k in order]
@@ -0,0 +1,77 @@
+import os
+import importlib
+import numpy as np
+
+from .stats import ErrorStat
+from .result import VariableResult, FileResult
+
+# format -> (module, class)
+FORMATS = {
+    'ascii': ('ascii', 'TestAscii'),
+    'csv': ('csv', 'TestCSV'),
+    'fingerprint': ('fingerprint', 'TestFingerprint'),
+    'geotiff': ('geotiff', 'TestGeoTiff'),
+    'grib': ('grib2', 'TestGRIB2'),
+    'hdf5': ('h5', 'TestHDF5'),
+    'matlab': ('mat', 'TestMat'),
+    'netcdf': ('netcdf', 'TestNetcdf'),
+    'zarr': ('zarr2', 'TestZarr'),
+}
+
+
+def get_test_class(fmt):
+    # the format module is only imported once
+    fmt = fmt.lower()
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown format "{fmt}", expect one of {sorted(FORMATS)}')
+    module, cls = FORMATS[fmt]
+    return getattr(importlib.import_module(f'.{module}', __package__), cls)
+
+
+def guess_format(filename):
+    name = filename.lower()
+    classes = []
+    for fmt in FORMATS:
+        try:
+            classes.append((fmt, get_test_class(fmt)))
+        except ImportError:
+            pass
+    # check the longer extension first, e.g., ".fp.json"
+    for fmt, cls in sorted(classes, key=lambda x: -len(x[1].EXT)):
+        if name.endswith(cls.EXT.lower()):
+            return fmt
+    raise ValueError(f'unknown format of "{filename}"')
+
+
+def compare_files(file1, file2, fmt=None, **opts):
+    """
+    compare two files, and return FileResult
+
+    opts are the same as the command line options, e.g., ignore_var=['time'],
+    structure_only=True. Nothing is printed, unless "verbose" is set.
+    """
+    cls = get_test_class(fmt or guess_format(file1))
+    test = cls()
+    opts = test.load_config(**opts)
+    test.stop_on_mismatch = False
+    test.quiet = 'verbose' not in opts
+    test.current_file = os.path.basename(file1)
+    test.results = []
+    try:
+        match = test.test(file1, file2)
+    finally:
+        test.renderer.flush()
+    return FileResult(file1, file2, match, getattr(test, 'match_attr', None), test.results)
+
+
+def compare_arrays(a, b, name=None, top_k=5):
+    """compare two arrays, and return VariableResult"""
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if a.shape != b.shape:
+        return VariableResult(name, False, a.shape, b.shape)
+    stat = ErrorStat(a.shape, top_k)
+    stat.update(a, b)
+    return VariableResult.from_stat(name, stat.match, a.shape, b.shape,
+                                    None if stat.match else stat)
+
@@ -0,0 +1,123 @@
+import os
+import shutil
+import filecmp
+import zipfile
+import tarfile
+
+ARCHIVE_EXT = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(path):
+    return path is not None and os.path.isfile(path) and path.lower().endswith(ARCHIVE_EXT)
+
+
+def open_source(path):
+    if is_archive(path):
+        return Archive(path)
+    return Folder(path)
+
+
+class Folder:
+    # the same interface as Archive, for comparing a folder with an archive
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        for root, _, files in os.walk(self.path):
+            for f in sorted(files):
+                yield os.path.relpath(os.path.join(root, f), self.path).replace(os.sep, '/')
+
+    def __contains__(self, name):
+        return os.path.isfile(os.path.join(self.path, name))
+
+    def size(self, name):
+        return os.path.getsize(os.path.join(self.path, name))
+
+    def crc(self, name):
+        return None
+
+    def open(self, name):
+        return open(os.path.join(self.path, name), 'rb')
+
+    def extract(self, name, folder):
+        # already on disk
+        return os.path.join(self.path, name)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Archive(Folder):
+    # the members of a zip or tar file, which are only extracted when needed
+    BLOCK_SIZE = 4*1024*1024
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._zip = self._tar = None
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            self._members = {i.filename: i for i in self._zip.infolist() if not i.is_dir()}
+        else:
+            self._tar = tarfile.open(path, 'r:*')
+            self._members = {self.normalize(m.name): m for m in self._tar.getmembers() if m.isfile()}
+
+    @staticmethod
+    def normalize(name):
+        return name[2:] if name.startswith('./') else name
+
+    def names(self):
+        # in the archive order, so a compressed tar file is read forward
+        yield from self._members
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def size(self, name):
+        m = self._members[name]
+        return m.file_size if self._zip is not None else m.size
+
+    def crc(self, name):
+        return self._members[name].CRC if self._zip is not None else None
+
+    def open(self, name):
+        if self._zip is not None:
+            return self._zip.open(self._members[name])
+        return self._tar.extractfile(self._members[name])
+
+    def extract(self, name, folder):
+        # keep the basename only, so the extension is the same and the file
+        # can't be written outside the folder
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, os.path.basename(name))
+        with self.open(name) as src, open(filename, 'wb') as dst:
+            shutil.copyfileobj(src, dst, self.BLOCK_SIZE)
+        return filename
+
+    def close(self):
+        for f in (self._zip, self._tar):
+            if f is not None:
+                f.close()
+
+
+def is_same(src1, src2, name):
+    # whether the member is byte-identical in both from the index: False if
+    # the sizes differ, the CRCs of zip if available, otherwise None (the
+    # data needs to be compared)
+    if src1.size(name) != src2.size(name):
+        return False
+    crc1, crc2 = src1.crc(name), src2.crc(name)
+    if crc1 is not None and crc2 is not None:
+        return crc1 == crc2
+    return None
+
+
+def is_same_file(file1, file2):
+    # compare the extracted members, so each member of a (compressed) tar
+    # file is only read once, forward
+    return filecmp.cmp(file1, file2, shallow=False)
@@ -3,16 +3,87 @@ import traceback
 import glob
 import re
 import functools
+import hashlib
+import json
+import time
+import tempfile
+import fnmatch
+import math
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import click
 from click.core import ParameterSource
 import yaml
 import tqdm
+from .journal import Journal
+from .prefetch import Prefetcher
+from .archive import is_archive, open_source, is_same, is_same_file
+from .align import Alignment, to_slice
+from .stats import StreamStat, ErrorStat, wilson_interval
+from . import kernels
+from .result import VariableResult
+from .render import get_renderer
+
+# the # of threads in the shared pool, the same as the default of
+# ThreadPoolExecutor
+NUM_THREADS = min(32, (os.cpu_count() or 1) + 4)
+_executor = None
+def get_executor():
+    # the thread pool shared by all the tests in the process
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=NUM_THREADS, thread_name_prefix='bsmcmp')
+    return _executor
+
+def as_list(value):
+    # the value of the multiple option, e.g., ignore_var='time' from python
+    if value is None:
+        return []
+    if isinstance(value, (str, int, float)):
+        return [value]
+    return list(value)
+
+
+def same_value(v1, v2):
+    # the values (e.g., of the schema) are the same, nan is equal to nan
+    try:
+        return bool(np.array_equal(v1, v2, equal_nan=True))
+    except (TypeError, ValueError):
+        return bool(v1 == v2)
+
+
+def parse_shard(ctx, param, value):
+    if value is None or isinstance(value, (tuple, list)):
+        return value
+    try:
+        index, count = [int(v) for v in value.split('/')]
+        if 0 <= index < count:
+            return index, count
+    except ValueError:
+        pass
+    raise click.BadParameter(f'expect I/N with 0 <= I < N, got "{value}"')
+
+def parse_sample(ctx, param, value):
+    # FRACTION (0, 1) of the blocks, or N blocks
+    if value is None or isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value is not None and value <= 0:
+            raise click.BadParameter(f'expect a positive number, got "{value}"')
+        return value
+    try:
+        v = float(value)
+    except ValueError:
+        raise click.BadParameter(f'expect FRACTION or N, got "{value}"')
+    if v <= 0 or (v >= 1 and not v.is_integer()):
+        raise click.BadParameter(f'expect FRACTION (0, 1) or integer N, got "{value}"')
+    return v if v < 1 else int(v)
+
 
 class TestBase:
     NAME = "base"
     EXT = ".*"
+    # whether the "file" is a folder, e.g., Zarr store
+    DIR_OK = False
     LOG_NONE = 0
     LOG_ERROR = 1
     LOG_WARN = 2
@@ -34,6 +105,15 @@ class TestBase:
         self._msgs = []
         self.message_delay = 0
         self.match = False
+        self.resume = None
+        self.shard = None
+        self.prefetch = 0
+        self.prefetch_memory = 1024
+        self.current_file = None
+        self.quiet = False
+        self.watch = False
+        self.watch_interval = 2.0
+        self.renderer = get_renderer()
 
     def _verbose(self, kwargs):
         return kwargs.pop('verbose', 0) or self.verbose
@@ -49,25 +129,19 @@ class TestBase:
             self._msgs = []
 
     def flush(self):
-        for args, kwargs in self._msgs:
-            self._echo(*args, **kwargs)
+        for text in self._msgs:
+            self.renderer.write(text)
         self._msgs = []
 
     def echo(self, *args, **kwargs):
+        if self.quiet:
+            return
+        # format once, the delayed messages are kept as text
+        text = self.renderer.format(*args, **kwargs)
         if self.message_delay:
-            self._msgs.append([args, kwargs])
+            self._msgs.append(text)
             return
-        self._echo(*args, **kwargs)
-
-    def _echo(self, *args, **kwargs):
-        if not self.tqdm_mode:
-            click.secho(*args, **kwargs)
-        else:
-            end = '\n'
-            if not kwargs.get('nl', True):
-                end = ''
-            kwargs.pop('nl', None)
-            tqdm.tqdm.write(click.style(*args, **kwargs), end=end)
+        self.renderer.write(text)
 
     def info(self, *args, **kwargs):
         if self._verbose(kwargs) < self.LOG_INFO:
@@ -113,6 +187,30 @@ class TestBase:
     def shall_ignore(self, filename):
         return self.has_pattern(filename, self.ignore_pattern)
 
+    def in_shard(self, file):
+        # stable hash partition, so each machine sees the same subset in every run
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        h = hashlib.md5(file.encode('utf-8')).digest()
+        return int.from_bytes(h[:8], 'little') % count == index
+
+    def get_record(self, file, match):
+        # the result of one file pair, saved in the journal
+        return {'file': file, 'match': bool(match)}
+
+    def restore_record(self, record):
+        # merge the result from the journal, as if the file pair has been tested
+        self.file_count += 1
+        if not record['match']:
+            self.mismatch_count += 1
+            if self.stop_on_mismatch:
+                self._stop = True
+
+    def reset_result(self):
+        self.file_count = 0
+        self.mismatch_count = 0
+
     def show_result(self):
         self.info(f'{self.file_count} files checked!', verbose=self.LOG_MAX)
         self.info('    mismatch: ', nl=False, verbose=self.LOG_MAX)
@@ -120,6 +218,7 @@ class TestBase:
             self.error(f'{self.mismatch_count}', verbose=self.LOG_MAX)
         else:
             self.success(f'{self.mismatch_count}', verbose=self.LOG_MAX)
+        self.renderer.flush()
 
     def show_pass_fail(self, name, match, verbose):
         if match:
@@ -135,40 +234,294 @@ class TestBase:
         self.info("overall:", verbose=verbose)
         self.show_pass_fail('data', self.match, verbose)
 
+    def is_file(self, filename):
+        return os.path.isfile(filename)
+
+    def get_pairs(self, folder1, folder2):
+        # (file1, file2, file_rel) of the files to be compared in folder mode
+        for filename in glob.iglob(f'{folder1}/**/*{self.ext}', recursive=self.recursive):
+            if self.shall_ignore(filename):
+                continue
+            file_rel = str(Path(filename).relative_to(folder1).as_posix())
+            if not self.in_shard(file_rel):
+                continue
+            yield filename, filename.replace(folder1, folder2), file_rel
+
+    def get_archive_pairs(self, folder1, folder2, skip=None):
+        # the members of the archives (or the files in the folder) paired by
+        # path; only the pair being compared is extracted to the temporary
+        # folder, and file1 is None if the pair is byte-identical. The pairs
+        # skip(name) is true for (e.g., in the journal) are neither read nor
+        # extracted
+        with open_source(folder1) as src1, open_source(folder2) as src2, \
+             tempfile.TemporaryDirectory(prefix='bsmcmp') as tmp:
+            for name in src1.names():
+                if not fnmatch.fnmatch(name, f'*{self.ext}') or (not self.recursive and '/' in name):
+                    continue
+                file1 = f'{folder1}/{name}'
+                if self.shall_ignore(file1) or not self.in_shard(name):
+                    continue
+                if name not in src2 or (skip is not None and skip(name)):
+                    yield file1, f'{folder2}/{name}', name
+                    continue
+                same = is_same(src1, src2, name)
+                if same:
+                    yield None, None, name
+                    continue
+                files = [src1.extract(name, os.path.join(tmp, '1')),
+                         src2.extract(name, os.path.join(tmp, '2'))]
+                try:
+                    if same is None and is_same_file(*files):
+                        yield None, None, name
+                    else:
+                        yield files[0], files[1], name
+                finally:
+                    for f in files:
+                        if f.startswith(tmp):
+                            os.remove(f)
+
+    def get_identical_record(self, file):
+        # the record of the byte-identical file pair, without comparing them
+        record = self.get_record(file, True)
+        if 'match_attr' in record:
+            record['match_attr'] = True
+        return record
+
+    @staticmethod
+    def get_signature(*files):
+        sig = []
+        for file in files:
+            try:
+                st = os.stat(file)
+                sig += [st.st_mtime_ns, st.st_size]
+            except OSError:
+                sig += [None, None]
+        return sig
+
+    def watch_all(self, folder1, folder2):
+        # compare all the file pairs, then poll the folders, and only compare
+        # the file pairs changed since the last time, until ctrl-c
+        self.stop_on_mismatch = False
+        # file_rel -> (signature, record), record is None if not compared
+        index = {}
+        self.tqdm_mode = True
+        try:
+            while True:
+                pairs = set()
+                changed = 0
+                for file1, file2, file_rel in self.get_pairs(folder1, folder2):
+                    pairs.add(file_rel)
+                    # before the comparison, so the file modified meanwhile
+                    # will be compared again
+                    sig = self.get_signature(file1, file2)
+                    if file_rel in index and index[file_rel][0] == sig:
+                        continue
+                    changed += 1
+                    index[file_rel] = (sig, None)
+                    self.current_file = file_rel
+                    self.error(f"\n{file_rel}", fg=None)
+                    if not self.is_file(file2):
+                        self.warning(f"can't find file: {file2}")
+                        continue
+                    try:
+                        match = self.test(file1, file2)
+                        index[file_rel] = (sig, self.get_record(file_rel, match))
+                    except:
+                        # e.g., the file is being written
+                        self.renderer.flush()
+                        traceback.print_exc()
+
+                removed = [f for f in index if f not in pairs]
+                for file in removed:
+                    del index[file]
+                if changed or removed:
+                    self.show_watch_result(index)
+                time.sleep(self.watch_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.tqdm_mode = False
+        return True
+
+    def show_watch_result(self, index):
+        self.reset_result()
+        mismatched = []
+        for file, (_, record) in sorted(index.items()):
+            if record is None:
+                continue
+            self.restore_record(record)
+            if not record['match'] or not record.get('match_attr', True):
+                mismatched.append(file)
+        self.info(f"\n[{time.strftime('%H:%M:%S')}] ", nl=False, verbose=self.LOG_MAX)
+        self.show_result()
+        for file in mismatched:
+            self.error(f'    {file}', fg=None, verbose=self.LOG_MAX)
+        self.renderer.flush()
+
     def test_all(self, folder1, folder2):
         self._stop = False
+        archive = is_archive(folder1) or is_archive(folder2)
+        if folder1 is not None and folder2 is not None and self.watch and not archive:
+            return self.watch_all(folder1, folder2)
         if folder1 is not None and folder2 is not None:
+            journal = None
+            resume = self.resume
+            if resume is None and self.shard is not None:
+                resume = f'{self.NAME.lower()}_shard_{self.shard[0]}_{self.shard[1]}.jsonl'
+            if resume:
+                header = {'format': self.NAME, 'folder1': os.path.abspath(folder1),
+                          'folder2': os.path.abspath(folder2),
+                          'shard': list(self.shard) if self.shard is not None else None}
+                old = Journal.load_header(resume) if self.resume else None
+                if old is not None and old != header:
+                    raise click.UsageError(f'"{resume}" is the result of {old["folder1"]} / {old["folder2"]} '
+                                           f'(shard {old["shard"]}), not of this run')
+                # the result of the shard is written to a new file, unless
+                # resumed explicitly
+                journal = Journal(resume, header, fresh=self.resume is None)
+                # always create the file, e.g., for "merge" even if the shard
+                # has no file
+                journal.open()
+                if journal.records:
+                    self.info(f'{len(journal.records)} files restored from {resume}', verbose=self.LOG_MAX)
+
+            def _prefetch_files(pair):
+                if journal is not None and pair[2] in journal:
+                    return []
+                return pair[:2]
+
+            if archive:
+                # the members are extracted one pair at a time, nothing to
+                # read ahead
+                pairs = self.get_archive_pairs(folder1, folder2,
+                                               None if journal is None else journal.__contains__)
+                prefetcher = Prefetcher(0)
+            else:
+                pairs = self.get_pairs(folder1, folder2)
+                prefetcher = Prefetcher(self.prefetch, self.prefetch_memory*1024*1024)
             self.tqdm_mode = True
-            for filename in tqdm.tqdm(glob.iglob(f'{folder1}/**/*{self.ext}', recursive=self.recursive), unit='file'):
-                if self.shall_stop():
-                    break
+            try:
+                for file1, file2, file_rel in tqdm.tqdm(prefetcher.iter(pairs, _prefetch_files), unit='file', mininterval=0.5):
+                    if self.shall_stop():
+                        break
+
+                    if journal is not None and file_rel in journal:
+                        self.restore_record(journal[file_rel])
+                        continue
+                    if file1 is None:
+                        record = self.get_identical_record(file_rel)
+                        self.restore_record(record)
+                        if journal is not None:
+                            journal.write(record)
+                        continue
+                    self.current_file = file_rel
+                    self.error(f"\n#{self.file_count+1}", fg=None)
+                    self.error(file_rel, fg=None)
+                    if not self.is_file(file2):
+                        self.warning(f"can't find file: {file2}")
+                        continue
+                    try:
+                        match = self.test(file1, file2)
+                        if journal is not None:
+                            journal.write(self.get_record(file_rel, match))
+                        if not match and self.verbose == self.LOG_NONE:
+                            self.info(f"\n#{self.mismatch_count} mismatch", verbose=self.LOG_MAX)
+                            self.info(file_rel, verbose=self.LOG_MAX)
+                    except:
+                        if self.verbose == self.LOG_NONE:
+                            self.info(file_rel, verbose=self.LOG_MAX)
+                        self.renderer.flush()
+                        traceback.print_exc()
+                        break
+            finally:
+                pairs.close()
+                if journal is not None:
+                    journal.close()
 
-                file1 = filename
-                file2 = filename.replace(folder1, folder2)
-                file_rel = str(Path(file1).relative_to(folder1).as_posix())
-                if self.shall_ignore(filename):
-                    continue
-                self.error(f"\n#{self.file_count+1}", fg=None)
-                self.error(file_rel, fg=None)
-                if not os.path.isfile(file2):
+            self.tqdm_mode = False
+            self.show_result()
+            return True
+        return False
+
+    def start_baseline(self):
+        # called before file1 is compared with the candidates
+        pass
+
+    def end_baseline(self):
+        pass
+
+    def compare_candidates(self, file1, files2, file_rel):
+        # compare file1 with each candidate, and return the records (None if
+        # the candidate is missing)
+        records = []
+        self.start_baseline()
+        try:
+            for k, file2 in enumerate(files2):
+                self.error(f"[{k}] {file2}", fg=None)
+                if not self.is_file(file2):
                     self.warning(f"can't find file: {file2}")
+                    records.append(None)
                     continue
+                # e.g., dump_diff for each candidate
+                self.current_file = f'{file_rel}.{k}'
+                match = self.test(file1, file2)
+                records.append(self.get_record(file_rel, match))
+        finally:
+            self.end_baseline()
+        return records
+
+    def show_candidates(self, candidates, rows):
+        # the result matrix, one row for each file, one column for each candidate
+        verbose = self.LOG_MAX
+        self.info("--------", verbose=verbose)
+        for k, c in enumerate(candidates):
+            self.info(f"[{k}] {c}", verbose=verbose)
+        width = max([len(file) for file, _ in rows] + [len('mismatch')])
+        self.info(' '*width + ''.join(f'{f"[{k}]":>6}' for k in range(len(candidates))), verbose=verbose)
+        mismatch = [0]*len(candidates)
+        for file, records in rows:
+            self.info(f'{file:<{width}}', nl=False, verbose=verbose)
+            for k, record in enumerate(records):
+                if record is None:
+                    self.warning(f'{"-":>6}', nl=False, verbose=verbose)
+                elif not record['match']:
+                    self.error(f'{"fail":>6}', nl=False, verbose=verbose)
+                elif not record.get('match_attr', True):
+                    self.error(f'{"attr":>6}', nl=False, verbose=verbose)
+                else:
+                    self.success(f'{"pass":>6}', nl=False, verbose=verbose)
+                if record is None or not record['match'] or not record.get('match_attr', True):
+                    mismatch[k] += 1
+            self.info('', verbose=verbose)
+        self.info(f'{"mismatch":<{width}}' + ''.join(f'{n:>6}' for n in mismatch), verbose=verbose)
+        self.renderer.flush()
+
+    def test_candidates(self, file1, files2):
+        self.stop_on_mismatch = False
+        records = self.compare_candidates(file1, files2, os.path.basename(file1))
+        self.show_candidates(files2, [(os.path.basename(file1), records)])
+
+    def test_all_candidates(self, folder1, folders2):
+        # compare the files in folder1 with the ones in each candidate folder
+        self.stop_on_mismatch = False
+        rows = []
+        self.tqdm_mode = True
+        try:
+            for file1, _, file_rel in tqdm.tqdm(self.get_pairs(folder1, folders2[0]), unit='file', mininterval=0.5):
+                self.error(f"\n#{len(rows)+1}", fg=None)
+                self.error(file_rel, fg=None)
+                files2 = [os.path.join(folder, file_rel) for folder in folders2]
                 try:
-                    match = self.test(file1, file2)
-                    if not match and self.verbose == self.LOG_NONE:
-                        self.info(f"\n#{self.mismatch_count} mismatch", verbose=self.LOG_MAX)
-                        self.info(file_rel, verbose=self.LOG_MAX)
+                    rows.append((file_rel, self.compare_candidates(file1, files2, file_rel)))
                 except:
                     if self.verbose == self.LOG_NONE:
                         self.info(file_rel, verbose=self.LOG_MAX)
+                    self.renderer.flush()
                     traceback.print_exc()
                     break
-
-
+        finally:
             self.tqdm_mode = False
-            self.show_result()
-            return True
-        return False
+        self.show_candidates(folders2, rows)
 
     def load_config(self, **kwargs):
         if 'config' in kwargs and os.path.isfile(kwargs['config']):
@@ -177,54 +530,108 @@ class TestBase:
                     cfg = yaml.safe_load(fp)
                     if self.NAME.lower() in cfg:
                         cfg = cfg[self.NAME.lower()]
-                        for option in kwargs:
-                            src = click.get_current_context().get_parameter_source(option)
-                            if src == ParameterSource.COMMANDLINE:
-                                continue
-                            kwargs[option] = cfg.get(option, kwargs[option])
+                        ctx = click.get_current_context(silent=True)
+                        if ctx is None:
+                            # called from python, all the arguments are explicit
+                            for option, value in cfg.items():
+                                kwargs.setdefault(option, value)
+                        else:
+                            for option in kwargs:
+                                src = ctx.get_parameter_source(option)
+                                if src == ParameterSource.COMMANDLINE:
+                                    continue
+                                kwargs[option] = cfg.get(option, kwargs[option])
             except:
                 self.error(f"Fail to load {kwargs['config']}", verbose=True)
+                self.renderer.flush()
                 traceback.print_exc()
 
         self.verbose = kwargs.get('verbose', self.verbose)
         self.ext = kwargs.get('ext', self.ext)
         self.stop_on_mismatch = kwargs.get('stop_on_mismatch', self.stop_on_mismatch)
-        self.ignore_pattern = kwargs.get('ignore_pattern', self.ignore_pattern)
+        self.ignore_pattern = as_list(kwargs.get('ignore_pattern', self.ignore_pattern))
         self.recursive = kwargs.get('recursive', self.recursive)
+        self.resume = kwargs.get('resume', self.resume)
+        # the value from the config file is not parsed by click
+        self.shard = parse_shard(None, None, kwargs.get('shard', self.shard))
+        self.prefetch = kwargs.get('prefetch', self.prefetch)
+        self.prefetch_memory = kwargs.get('prefetch_memory', self.prefetch_memory)
+        self.watch = kwargs.get('watch', self.watch)
+        self.watch_interval = kwargs.get('watch_interval', self.watch_interval)
+        # more than one file2/folder2 (candidates) to be compared with file1/folder1
+        for key in ['file2', 'folder2']:
+            value = kwargs.get(key)
+            if isinstance(value, (list, tuple)):
+                kwargs[key] = value[0] if len(value) == 1 else (list(value) or None)
+        if isinstance(kwargs.get('file2'), list) and kwargs.get('file1') is None:
+            raise click.UsageError('"file1" is required to compare with multiple "file2"')
         return kwargs
 
+    def run_candidates(self, **kwargs):
+        # return True if there are multiple file2/folder2
+        if isinstance(kwargs['file2'], list) or isinstance(kwargs['folder2'], list):
+            for option in ['resume', 'shard', 'watch']:
+                if kwargs.get(option):
+                    raise click.UsageError(f'"{option}" is not supported with multiple "file2"/"folder2"')
+        if isinstance(kwargs['folder2'], list) and \
+           any(is_archive(f) for f in [kwargs['folder1']] + kwargs['folder2']):
+            raise click.UsageError('the archives are not supported with multiple "folder2"')
+        if isinstance(kwargs['file2'], list):
+            if self.verbose == self.LOG_AUTO:
+                self.verbose = self.LOG_INFO
+            self.test_candidates(kwargs['file1'], kwargs['file2'])
+            return True
+        if kwargs['folder1'] is not None and isinstance(kwargs['folder2'], list):
+            if self.verbose == self.LOG_AUTO:
+                self.verbose = self.LOG_NONE
+            self.test_all_candidates(kwargs['folder1'], kwargs['folder2'])
+            return True
+        return False
+
     @classmethod
     def run(cls, **kwargs):
         test = cls()
-        kwargs = test.load_config(**kwargs)
-        if kwargs['file1'] is None or kwargs['file2'] is None:
-            file = kwargs['file1'] or kwargs['file2']
-            if file is not None:
-                test.stat(file)
-        if kwargs['file1'] is not None and kwargs['file2'] is not None:
-            test.stop_on_mismatch = False
-            if test.verbose == test.LOG_AUTO:
-                test.verbose = test.LOG_INFO
-            test.test(kwargs['file1'], kwargs['file2'])
-            test.show_result()
-            return
-        if kwargs['folder1'] is not None and kwargs['folder2'] is not None:
-            if test.verbose == test.LOG_AUTO:
-                test.verbose = test.LOG_NONE
-            test.test_all(kwargs['folder1'], kwargs['folder2'])
+        try:
+            kwargs = test.load_config(**kwargs)
+            if test.run_candidates(**kwargs):
+                return
+            if kwargs['file1'] is None or kwargs['file2'] is None:
+                file = kwargs['file1'] or kwargs['file2']
+                if file is not None:
+                    test.stat(file)
+            if kwargs['file1'] is not None and kwargs['file2'] is not None:
+                test.stop_on_mismatch = False
+                test.current_file = os.path.basename(kwargs['file1'])
+                if test.verbose == test.LOG_AUTO:
+                    test.verbose = test.LOG_INFO
+                test.test(kwargs['file1'], kwargs['file2'])
+                test.show_result()
+                return
+            if kwargs['folder1'] is not None and kwargs['folder2'] is not None:
+                if test.verbose == test.LOG_AUTO:
+                    test.verbose = test.LOG_NONE
+                test.test_all(kwargs['folder1'], kwargs['folder2'])
+        finally:
+            test.renderer.flush()
 
     @classmethod
     def get_options(cls):
         return [
                 click.option('-v', '--verbose', default=cls.LOG_AUTO, count=True),
                 click.option('--ext', default=cls.EXT, help=f'the {cls.NAME} file extention'),
-                click.option('--file1', type=click.Path(exists=True, dir_okay=False), help=f'1st {cls.NAME} file. If "file2" is missing, show the statistics info of "file1".'),
-                click.option('--file2', type=click.Path(exists=True, dir_okay=False), help=f'2nd {cls.NAME} file. If "file1" is missing, show the statistics info of "file2".'),
-                click.option('--folder1', type=click.Path(exists=True, file_okay=False), help=f'1st top folder contains {cls.NAME} files.'),
-                click.option('--folder2', type=click.Path(exists=True, file_okay=False), help=f'2nd top folder contains {cls.NAME} files. folder1 and folder2 shall have the same structure'),
+                click.option('--file1', type=click.Path(exists=True, dir_okay=cls.DIR_OK), help=f'1st {cls.NAME} file. If "file2" is missing, show the statistics info of "file1".'),
+                click.option('--file2', type=click.Path(exists=True, dir_okay=cls.DIR_OK), multiple=True, help=f'2nd {cls.NAME} file. If "file1" is missing, show the statistics info of "file2". If more than one, "file1" is compared with each of them.'),
+                click.option('--folder1', type=click.Path(exists=True), help=f'1st top folder (or zip/tar archive) contains {cls.NAME} files.'),
+                click.option('--folder2', type=click.Path(exists=True), multiple=True, help=f'2nd top folder (or zip/tar archive) contains {cls.NAME} files. folder1 and folder2 shall have the same structure. If more than one, folder1 is compared with each of them.'),
                 click.option('--stop_on_mismatch/--no-stop_on_mismatch', is_flag=True, default=True, help='Stop when see any data mismatch'),
                 click.option('--ignore_pattern', '-i', multiple=True, help='filename pattern to be ignored'),
                 click.option('--recursive/--no-recursive', default=True, is_flag=True, help='search the subfolders recursively'),
+                click.option('--resume', type=click.Path(dir_okay=False), help='journal file to save the result of each file pair in folder mode; the file pairs already in the journal are skipped'),
+                click.option('--shard', callback=parse_shard, metavar='I/N', help='only compare the I-th (0-based) of N shards of the file pairs in folder mode; the result is saved to a new file "NAME_shard_I_N.jsonl" (or the "resume" journal to continue the shard), see "bsmcmp merge"'),
+                click.option('--prefetch', default=0, type=click.IntRange(min=0), help='number of the next file pairs to read ahead in background in folder mode; also read both sides of each variable concurrently (if the format allows, e.g., GRIB), and for HDF5, let the OS read the next dataset ahead'),
+                click.option('--prefetch_memory', default=1024, type=click.IntRange(min=1), help='maximum size (MB) of the files being read ahead'),
+                click.option('--watch', is_flag=True, default=False, help='in folder mode, keep watching the folders, and compare the file pairs again when they are changed (ctrl-c to quit)'),
+                click.option('--watch_interval', default=2.0, type=click.FloatRange(min=0.1), help='interval (seconds) to check the changes of the folders in "watch" mode'),
                 click.option('--config', default='file_compare.yml', type=click.Path(exists=False, dir_okay=False), help='the configuation in yaml file'),
                 ]
 
@@ -239,56 +646,429 @@ class TestBase:
 
 class TestBaseGroup(TestBase):
     NAME = 'TestBaseGroup'
+    # whether get_data() can be called from multiple threads
+    CONCURRENT_READ = True
+    # minimum size (bytes) of each sampled block
+    SAMPLE_BLOCK = 1024*1024
     def __init__(self):
         super().__init__()
         self.ignore_variables = []
+        self.fingerprint = None
+        self.fingerprint_bins = 0
+        self._fingerprints = {}
+        self.percentiles = []
+        self.block_size = 64
+        self.structure_only = False
+        self.top_k = 5
+        self.dump_diff = None
+        self._diff = None
+        self.sample = None
+        # align the variables by the dimension names and coordinate values
+        self.align = False
+        self.baseline_memory = 1024
+        # MB, 0 for no limit
+        self.max_memory = 0
+        # the data of file1 when compared with multiple candidates
+        self._baseline = None
+        self._baseline_size = 0
+        # list to collect the VariableResult, e.g., for python API
+        self.results = None
 
     def get_data(self, d):
         raise NotImplementedError
 
-    def stat_data(self, d, indent=''):
-        d = self.get_data(d)
-        self.error(f"{indent}data: ", fg='green')
-        d_f = d.flatten()
-        n_nan = np.sum(np.isnan(d_f))
-
-        self.error(f"{indent}    max: {np.nanmax(d_f):.6g}", fg=None)
-        self.error(f"{indent}    min: {np.nanmin(d_f):.6g}", fg=None)
-        self.error(f"{indent}    avg: {np.nanmean(d_f):.6g}", fg=None)
-        self.error(f"{indent}    std: {np.nanstd(d_f):.6g}", fg=None)
-        self.error(f"{indent}    % nan: {n_nan*100/len(d_f):.6g}% ({n_nan}/{len(d_f)})", fg=None)
+    def start_baseline(self):
+        self._baseline = {}
+        self._baseline_size = 0
+
+    def end_baseline(self):
+        self._baseline = None
+        self._baseline_size = 0
+
+    def get_baseline_key(self, d, name):
+        # the key of the variable in the baseline cache, which shall be unique
+        # in the file
+        return name
+
+    def get_baseline(self, d1, name):
+        # read the variable of file1 once for all the candidates, if it fits
+        # in the memory limit
+        if name in self._baseline:
+            return self._baseline[name]
+        data = self.get_data(d1)
+        size = data.nbytes
+        if self._baseline_size + size <= self.baseline_memory*1024*1024:
+            # copy the data not owned (e.g., memory-mapped, which may be a
+            # plain view of the map), so the file can be closed after each
+            # candidate
+            if not data.flags.owndata:
+                data = np.array(data)
+            self._baseline[name] = data
+            self._baseline_size += size
+        return data
+
+    def estimate_memory(self, d1, d2=None):
+        # the peak memory (bytes) to compare the variables in memory: the
+        # data (get_data() may convert it to float64), and the temporary
+        # arrays (error, mismatch, ...) of ErrorStat; None if unknown
+        shape = getattr(d1, 'shape', None)
+        dtype = getattr(d1, 'dtype', None)
+        if shape is None or dtype is None:
+            return None
+        try:
+            size = int(np.prod(shape, dtype=np.int64))
+            itemsize = max(np.dtype(dtype).itemsize, 8)
+        except TypeError:
+            return None
+        n = 1 if d2 is None else 2
+        return size*(itemsize*n + 26)
+
+    def over_budget(self, size):
+        return self.max_memory > 0 and size is not None and size > self.max_memory*1024*1024
+
+    def get_data_pair(self, d1, d2, name=None):
+        if self._baseline is not None and name is not None:
+            return self.get_baseline(d1, self.get_baseline_key(d1, name)), self.get_data(d2)
+        if self.prefetch <= 0 or not self.CONCURRENT_READ or \
+           self.over_budget(2*(self.estimate_memory(d1, d2) or 0)):
+            # read one by one, so one side can be released if failed
+            return self.get_data(d1), self.get_data(d2)
+        # read both sides at the same time
+        f2 = get_executor().submit(self.get_data, d2)
+        try:
+            d1 = self.get_data(d1)
+        finally:
+            d2 = f2.result()
+        return d1, d2
+
+    def readahead(self, *ds):
+        # let the OS read the data of the variables (e.g., the next one) into
+        # the page cache in background, if prefetch is on
+        pass
+
+    def get_schema(self, d):
+        # the layout of the variable, which shall not read the data
+        return {'dtype': str(getattr(d, 'dtype', None)),
+                'shape': tuple(getattr(d, 'shape', ()))}
+
+    def add_result(self, result):
+        if self.results is not None:
+            self.results.append(result)
+
+    def check_schema(self, d1, d2, indent='', name=None):
+        s1 = self.get_schema(d1)
+        s2 = self.get_schema(d2)
+        match = s1.keys() == s2.keys() and all(same_value(s1[k], s2[k]) for k in s1)
+        self.add_result(VariableResult(name, match, s1.get('shape'), s2.get('shape')))
+        if match:
+            self.success(f"{indent}schema: ", fg=None, nl=False)
+            self.success("pass")
+            return match
+
+        self.error(f"{indent}schema: ", fg=None, nl=False)
+        self.error("fail")
+        for k in s1:
+            if k not in s2 or not same_value(s1[k], s2[k]):
+                self.error(f"{indent}    {k}: {s1[k]} / {s2.get(k)}", fg=None)
+        for k in s2:
+            if k not in s1:
+                self.error(f"{indent}    {k}: None / {s2[k]}", fg=None)
+        return match
 
+    def stat_schema(self, d, indent=''):
+        self.error(f"{indent}schema: ", fg='green')
+        for k, v in self.get_schema(d).items():
+            self.error(f"{indent}    {k}: {v}", fg=None)
+
+    def get_view(self, d):
+        # return an object that can be sliced to read part of the data, e.g.,
+        # the dataset itself or a memmap of it
+        return d
+
+    def iter_data(self, d):
+        # read the data by hyperslabs along the first axis, so the variable
+        # doesn't need to fit in memory
+        shape = getattr(d, 'shape', None)
+        if not shape or 0 in shape:
+            yield self.get_data(d)
+            return
+        row = int(np.prod(shape[1:], dtype=np.int64))
+        # assume the data is converted to float64 by get_data()
+        rows = self.align_rows(max(1, self.block_size*1024*1024 // (row*8)), d)
+        # the cache within the memory left by the block, if limited
+        limit = max(0, self.max_memory*1024*1024 - rows*row*8) if self.max_memory > 0 else None
+        d = self.get_view(self.set_chunk_cache(d, self.get_cache_size(d, limit)))
+        for i in range(0, shape[0], rows):
+            yield self.get_data(d[i:i+rows])
+
+    def align_rows(self, rows, *ds):
+        # round the # of rows of each block down to the whole chunks of all
+        # the variables, so no chunk is split between two blocks
+        step = 1
+        for d in ds:
+            chunks = self.get_chunks(d)
+            if chunks:
+                step = math.lcm(step, chunks[0])
+        if step <= rows:
+            return rows - rows % step
+        return rows
+
+    def get_cache_size(self, d, limit=None):
+        # bytes of one row of the chunks along the first axis, so the chunks
+        # split between two blocks stay in the cache for the next block; None
+        # (the default cache, the split chunks are decompressed again) if it
+        # is larger than limit
+        chunks = self.get_chunks(d)
+        if not chunks or len(chunks) != len(d.shape):
+            return None
+        size = chunks[0]*np.dtype(d.dtype).itemsize
+        for n, c in zip(d.shape[1:], chunks[1:]):
+            size *= -(-n // c)*c
+        if limit is not None and size > limit:
+            return None
+        return int(size)
+
+    def set_chunk_cache(self, d, nbytes):
+        # set the chunk cache of the variable to (at least) nbytes, and return
+        # the variable (which may be reopened)
+        return d
+
+    def get_chunks(self, d):
+        # the storage chunk shape of the variable, or None if it's not chunked
+        chunks = getattr(d, 'chunks', None)
+        if isinstance(chunks, tuple) and all(isinstance(c, (int, np.integer)) for c in chunks):
+            return chunks
+        return None
+
+    def get_dims(self, d):
+        # the dimension names of the variable, or None if unknown
+        return None
+
+    def get_coord(self, d, dim):
+        # the (1-D) coordinate values of the dimension of the variable, or
+        # None if there is no coordinate variable
+        return None
+
+    def get_alignment(self, d1, d2):
+        # the Alignment of the variables if they are not in the same layout,
+        # otherwise None
+        dims1, dims2 = self.get_dims(d1), self.get_dims(d2)
+        shape1, shape2 = tuple(getattr(d1, 'shape', ())), tuple(getattr(d2, 'shape', ()))
+        if not dims1 or not dims2 or len(dims1) != len(shape1) or len(dims2) != len(shape2):
+            return None
+
+        def _coords(d, dims, shape):
+            # the index if there is no coordinate variable
+            coords = []
+            for k, n in zip(dims, shape):
+                c = self.get_coord(d, k)
+                coords.append(np.arange(n) if c is None or np.ndim(c) != 1 or len(c) != n else c)
+            return coords
+
+        alignment = Alignment.create(dims1, dims2, _coords(d1, dims1, shape1), _coords(d2, dims2, shape2))
+        if alignment is None or alignment.is_identity(shape1, shape2):
+            return None
+        return alignment
+
+    def read_aligned(self, v, idx):
+        # read the block of the indices along each axis: the bounding
+        # hyperslab is read, and the indices are taken from it in memory, so
+        # the variable is never reindexed as a whole
+        lo = [int(i.min()) for i in idx]
+        if isinstance(idx[0], np.ndarray) and len(idx[0]) > 1 and \
+           idx[0].max() - lo[0] >= 4*len(idx[0]):
+            # the rows are too far apart, read them one by one
+            return np.concatenate([self.read_aligned(v, [idx[0][j:j+1]] + idx[1:])
+                                   for j in range(len(idx[0]))])
+        data = self.get_data(v[tuple(slice(l, int(i.max()) + 1) for l, i in zip(lo, idx))])
+        local = [to_slice(i - l) for i, l in zip(idx, lo)]
+        data = data[tuple(s if isinstance(s, slice) else slice(None) for s in local)]
+        for axis, s in enumerate(local):
+            if not isinstance(s, slice):
+                data = np.take(data, s, axis=axis)
+        return data
+
+    def check_data_aligned(self, d1, d2, alignment, indent='', name=None):
+        # compare the overlapping region of the variables block by block
+        # along the first axis of file1
+        shape = alignment.shape
+        self.info(f"{indent}aligned: {alignment.dims}, {tuple(d1.shape)} / {tuple(d2.shape)}, "
+                  f"overlap {shape}")
+        if 0 in shape:
+            self.error(f"{indent}data: ", fg=None, nl=False)
+            self.error("fail")
+            self.error(f"{indent}    no overlapping coordinates", fg=None)
+            self.add_result(VariableResult(name, False, tuple(d1.shape), tuple(d2.shape)))
+            return False
+        # the hyperslabs read for each row of the blocks (assume float64)
+        row = 8*max(int(np.prod([i.max() - i.min() + 1 for i in idx[1:]], dtype=np.int64))
+                    for idx in (alignment.idx1, alignment.idx2))
+        limit = self.max_memory if self.max_memory > 0 else self.block_size
+        rows = self.align_rows(max(1, limit*1024*1024 // (2*row)), d1)
+        v1, v2 = self.get_view(d1), self.get_view(d2)
+        stat = ErrorStat(shape, self.top_k, self.get_diff(name, shape))
+        for i in range(0, shape[0], rows):
+            sel1, sel2 = alignment.rows(i, i + rows)
+            a = self.read_aligned(v1, sel1)
+            b = np.transpose(self.read_aligned(v2, sel2), alignment.perm)
+            stat.update(a, b, (i,) + (0,)*(len(shape) - 1))
+        return self.show_stat(stat, indent, name)
+
+    def get_sample_block(self, d, shape):
+        # the block is one or more whole chunks along the first axis, so
+        # each chunk is decompressed at most once
+        chunks = self.get_chunks(d)
+        if chunks is None or len(chunks) != len(shape):
+            chunks = (1,) + tuple(shape[1:])
+        size = int(np.prod(chunks, dtype=np.int64))*8
+        rows = max(1, self.SAMPLE_BLOCK // max(size, 1))
+        return (min(chunks[0]*rows, shape[0]),) + tuple(chunks[1:])
+
+    def sample_data(self, d1, d2, indent='', name=None):
+        # compare a stratified random sample of the blocks, and return the
+        # # of elements compared, or None if any difference is found
+        shape = tuple(d1.shape)
+        block = self.get_sample_block(d1, shape)
+        grid = [-(-n // b) for n, b in zip(shape, block)]
+        total = int(np.prod(grid, dtype=np.int64))
+        n = self.sample*total if self.sample < 1 else self.sample
+        n = min(total, max(1, int(np.ceil(n))))
+        # one random block from each of the n strata, so the sample covers
+        # the whole variable
+        rng = np.random.default_rng(0)
+        edges = np.linspace(0, total, n + 1)
+        picks = np.unique(np.floor(edges[:-1] + rng.random(n)*np.diff(edges)).astype(np.int64))
+        v1, v2 = self.get_view(d1), self.get_view(d2)
+        n_elements = n_mismatch = n_block = 0
+        for i in picks:
+            index = np.unravel_index(i, grid)
+            s = tuple(slice(j*b, min((j + 1)*b, m)) for j, b, m in zip(index, block, shape))
+            a, b = self.get_data(v1[s]), self.get_data(v2[s])
+            mismatch = a != b
+            if np.issubdtype(a.dtype, np.inexact) and np.issubdtype(b.dtype, np.inexact):
+                mismatch &= ~(np.isnan(a) & np.isnan(b))
+            k = int(np.count_nonzero(mismatch))
+            n_elements += a.size
+            n_mismatch += k
+            n_block += k > 0
+
+        lo, hi = wilson_interval(n_block, len(picks))
+        self.info(f"{indent}sample: {len(picks)}/{total} blocks, "
+                  f"{n_mismatch}/{n_elements} elements mismatch")
+        self.info(f"{indent}    mismatched blocks: {n_block/len(picks)*100:.4g}% "
+                  f"[{lo*100:.4g}%, {hi*100:.4g}%] (95% confidence)")
+        if n_mismatch:
+            self.warning(f"{indent}sample mismatch, compare all the data")
+            return None
+        return n_elements
+
+    def get_fingerprint(self, stat, shape):
+        fp = {'dtype': stat.dtype.str if stat.dtype is not None else None,
+              'shape': list(shape), 'checksum': stat.checksum}
+        if not stat.numeric or stat.count == 0:
+            return fp
+        fp['nan'] = stat.n_nan
+        if stat.n > 0:
+            fp['min'] = stat.min
+            fp['max'] = stat.max
+            fp['sum'] = stat.sum
+            if self.fingerprint_bins > 0:
+                fp['hist'] = stat.histogram(self.fingerprint_bins).tolist()
+        return fp
+
+    def save_fingerprint(self, file):
+        fp = {'file': os.path.basename(file), 'format': self.NAME, 'variables': self._fingerprints}
+        with open(self.fingerprint, 'w', encoding='utf-8') as f:
+            json.dump(fp, f, indent=1)
+        self.info(f'fingerprint saved to {self.fingerprint}', verbose=self.LOG_MAX)
+
+    def stat_data(self, d, indent='', name=None):
+        if self.structure_only:
+            self.stat_schema(d, indent)
+            return
+        fingerprint = self.fingerprint and name is not None
+        sample_size = 0
+        if self.percentiles or (fingerprint and self.fingerprint_bins > 0):
+            sample_size = StreamStat.SAMPLE_SIZE
+        stat = StreamStat(checksum=fingerprint, sample_size=sample_size)
+        for block in self.iter_data(d):
+            stat.update(block)
+        if fingerprint:
+            self._fingerprints[name] = self.get_fingerprint(stat, getattr(d, 'shape', ()))
 
-    def check_data(self, d1, d2, indent=''):
-        d1 = self.get_data(d1)
-        d2 = self.get_data(d2)
+        self.error(f"{indent}data: ", fg='green')
+        if not stat.numeric:
+            self.error(f"{indent}    size: {stat.count}", fg=None)
+            return
+        self.error(f"{indent}    max: {stat.max:.6g}", fg=None)
+        self.error(f"{indent}    min: {stat.min:.6g}", fg=None)
+        self.error(f"{indent}    avg: {stat.avg:.6g}", fg=None)
+        self.error(f"{indent}    std: {stat.std:.6g}", fg=None)
+        if self.percentiles:
+            for q, v in zip(self.percentiles, stat.percentile(self.percentiles)):
+                self.error(f"{indent}    {q:g}%: {v:.6g}", fg=None)
+        n_nan, n_all = stat.n_nan, stat.count
+        self.error(f"{indent}    % nan: {n_nan*100/max(n_all, 1):.6g}% ({n_nan}/{n_all})", fg=None)
+
+
+    def get_diff(self, name, shape):
+        if not self.dump_diff or name is None:
+            return None
+        if self._diff is None:
+            from .diff import DiffWriter
+            filename = os.path.join(self.dump_diff, f'{self.current_file or "diff"}.diff.h5')
+            self._diff = DiffWriter(filename)
+        return self._diff.variable(name, shape)
+
+    def close_diff(self):
+        if self._diff is not None:
+            self._diff.close()
+            self._diff = None
+
+    def check_data(self, d1, d2, indent='', name=None):
+        if self.structure_only:
+            return self.check_schema(d1, d2, indent, name)
+        alignment = self.get_alignment(d1, d2) if self.align else None
+        if alignment is not None:
+            return self.check_data_aligned(d1, d2, alignment, indent, name)
+        shape1, shape2 = getattr(d1, 'shape', None), getattr(d2, 'shape', None)
+        if self.sample and shape1 and shape1 == shape2 and 0 not in shape1:
+            # escalate to the full comparison only if the sample is different
+            n = self.sample_data(d1, d2, indent, name)
+            if n is not None:
+                self.success(f"{indent}data: ", fg=None, nl=False)
+                self.success("pass (sample)")
+                self.add_result(VariableResult(name, True, tuple(shape1), tuple(shape2), 0, n))
+                return True
+        if shape1 is not None and shape2 is not None and tuple(shape1) != tuple(shape2):
+            # different shapes, nothing to read
+            self.error(f"{indent}data: ", fg=None, nl=False)
+            self.error("fail")
+            self.error(f"{indent}    d1.shape: {tuple(shape1)}", fg=None)
+            self.error(f"{indent}    d2.shape: {tuple(shape2)}", fg=None)
+            self.add_result(VariableResult(name, False, tuple(shape1), tuple(shape2)))
+            return False
+        if shape1 and shape1 == shape2 and self.over_budget(self.estimate_memory(d1, d2)):
+            return self.check_data_blocks(d1, d2, indent, name)
+        d1, d2 = self.get_data_pair(d1, d2, name)
         match = True
         if d1.shape == d2.shape:
             if not d1.shape:
                 # empty variable
                 match = True
             else:
-                # equal_nan is not supported for non-numeric data type
-                match = np.array_equal(d1, d2, equal_nan=np.issubdtype(d1.dtype, np.number))
+                match = kernels.array_equal(d1, d2)
         else:
             match = False
 
+        stat = None
         if not match:
             self.error(f"{indent}data: ", fg=None, nl=False)
             self.error("fail")
             if d1.shape == d2.shape:
-                err = np.abs(d1 - d2)
-                w = np.argwhere(err == np.max(err))
-                n_zero_err = np.sum((err.flatten() == 0))
-                n_all = len(err.flatten())
-
-                self.error(f"{indent}    max error: {np.nanmax(err):.6g} at", fg=None)
-                self.error(f"{indent}              " + str(w).replace('\n', f'\n{indent}              '), fg=None)
-                self.error(f"{indent}           d1: {d1[tuple(w[0])]}", fg=None)
-                self.error(f"{indent}           d2: {d2[tuple(w[0])]}", fg=None)
-                self.error(f"{indent}    avg error: {np.nanmean(err):.6g}", fg=None)
-                self.error(f"{indent}    std error: {np.nanstd(err):.6g}", fg=None)
-                self.error(f"{indent}      0 error: {n_zero_err/n_all*100:.4f}% ({n_zero_err}/{n_all})", fg=None)
+                stat = ErrorStat(d1.shape, self.top_k, self.get_diff(name, d1.shape))
+                stat.update(d1, d2, mismatched=True)
+                self.show_error(stat, indent)
             else:
                 self.error(f"{indent}    d1.shape: {d1.shape}", fg=None)
                 self.error(f"{indent}    d2.shape: {d2.shape}", fg=None)
@@ -296,8 +1076,66 @@ class TestBaseGroup(TestBase):
             self.success(f"{indent}data: ", fg=None, nl=False)
             self.success("pass")
 
+        self.add_result(VariableResult.from_stat(name, match, d1.shape, d2.shape, stat))
         return match
 
+    def check_data_blocks(self, d1, d2, indent='', name=None):
+        # compare the variables by hyperslabs along the first axis, each fits
+        # in the memory limit
+        shape = tuple(d1.shape)
+        budget = self.max_memory*1024*1024
+        # the chunk caches take at most half of the budget, and the blocks
+        # the rest
+        cache1 = self.get_cache_size(d1, budget // 4)
+        cache2 = self.get_cache_size(d2, budget // 4)
+        budget -= (cache1 or 0) + (cache2 or 0)
+        row = max(1, self.estimate_memory(d1, d2) // shape[0])
+        rows = self.align_rows(max(1, budget // row), d1, d2)
+        v1 = self.get_view(self.set_chunk_cache(d1, cache1))
+        v2 = self.get_view(self.set_chunk_cache(d2, cache2))
+        stat = ErrorStat(shape, self.top_k, self.get_diff(name, shape))
+        for i in range(0, shape[0], rows):
+            stat.update(self.get_data(v1[i:i+rows]), self.get_data(v2[i:i+rows]),
+                        (i,) + (0,)*(len(shape) - 1))
+        return self.show_stat(stat, indent, name)
+
+    def show_stat(self, stat, indent='', name=None):
+        # show the result of the variable compared block by block
+        match = stat.match
+        if match:
+            self.success(f"{indent}data: ", fg=None, nl=False)
+            self.success("pass")
+        else:
+            self.error(f"{indent}data: ", fg=None, nl=False)
+            self.error("fail")
+            self.show_error(stat, indent)
+        self.add_result(VariableResult.from_stat(name, match, stat.shape, stat.shape,
+                                                 None if match else stat))
+        return match
+
+    def show_error(self, stat, indent=''):
+        if stat.numeric:
+            self.error(f"{indent}    max error: {stat.err.max:.6g} at", fg=None)
+        else:
+            self.error(f"{indent}    mismatch at", fg=None)
+        for _, err, w, v1, v2 in stat.top:
+            err = f"{err:.6g}, " if err is not None else ""
+            self.error(f"{indent}              {list(w)}: {err}d1: {v1}, d2: {v2}", fg=None)
+        if stat.numeric:
+            self.error(f"{indent}    avg error: {stat.err.avg:.6g}", fg=None)
+            self.error(f"{indent}    std error: {stat.err.std:.6g}", fg=None)
+            n_zero_err, n_all = stat.n_zero, max(stat.count, 1)
+            self.error(f"{indent}      0 error: {n_zero_err/n_all*100:.4f}% ({n_zero_err}/{stat.count})", fg=None)
+        n_mismatch, n_all = stat.n_mismatch, max(stat.count, 1)
+        self.error(f"{indent}     mismatch: {n_mismatch/n_all*100:.4f}% ({n_mismatch}/{stat.count})", fg=None)
+        region = ', '.join(f'{lo}:{hi}' for lo, hi in stat.region)
+        self.error(f"{indent}       region: [{region}]", fg=None)
+        for axis, count in enumerate(stat.axis_count):
+            if count is None or len(stat.axis_count) <= 1:
+                continue
+            self.error(f"{indent}       axis {axis}: {np.count_nonzero(count)}/{len(count)} indices, "
+                       f"max {np.max(count)} mismatches at index {np.argmax(count)}", fg=None)
+
     def check_group(self, group1, group2, indent=""):
 
         raise NotImplementedError
@@ -309,7 +1147,10 @@ class TestBaseGroup(TestBase):
     def test(self, file1, file2):
         super().test(file1, file2)
 
-        match_data = self.do_test(file1, file2)
+        try:
+            match_data = self.do_test(file1, file2)
+        finally:
+            self.close_diff()
         if not match_data:
             self.mismatch_count += 1
 
@@ -326,17 +1167,42 @@ class TestBaseGroup(TestBase):
 
     def stat(self, file):
         super().stat(file)
+        self._fingerprints = {}
         self.do_stat(file)
+        if self.fingerprint:
+            self.save_fingerprint(file)
+        self.renderer.flush()
 
     def load_config(self, **kwargs):
         kwargs = super().load_config(**kwargs)
-        self.ignore_variables = kwargs.get('ignore_var', [])
+        self.ignore_variables = as_list(kwargs.get('ignore_var', []))
+        self.fingerprint = kwargs.get('fingerprint', self.fingerprint)
+        self.fingerprint_bins = kwargs.get('fingerprint_bins', self.fingerprint_bins)
+        self.percentiles = as_list(kwargs.get('percentile', self.percentiles))
+        self.block_size = kwargs.get('block_size', self.block_size)
+        self.structure_only = kwargs.get('structure_only', self.structure_only)
+        self.top_k = kwargs.get('top_k', self.top_k)
+        self.dump_diff = kwargs.get('dump_diff', self.dump_diff)
+        self.sample = parse_sample(None, None, kwargs.get('sample', self.sample))
+        self.align = kwargs.get('align', self.align)
+        self.baseline_memory = kwargs.get('baseline_memory', self.baseline_memory)
+        self.max_memory = kwargs.get('max_memory', self.max_memory)
         return kwargs
 
     @classmethod
     def get_options(cls):
         return super().get_options() + [
                 click.option('--ignore_var', multiple=True, help='variables to be ignored'),
+                click.option('--fingerprint', type=click.Path(dir_okay=False), help='save the fingerprint (checksum, min/max/sum, # of nan) of each variable to the file, when showing the statistics info of one file. See "bsmcmp fingerprint" to compare the fingerprints'),
+                click.option('--fingerprint_bins', default=0, type=click.IntRange(min=0), help='number of the histogram bins in the fingerprint'),
+                click.option('--percentile', multiple=True, type=click.FloatRange(0, 100), help='percentile to be estimated when showing the statistics info of one file'),
+                click.option('--structure_only', '--structure-only', is_flag=True, default=False, help='only compare the layout (e.g., dtype, shape, chunking, compression) and attributes of the variables, not the data'),
+                click.option('--top_k', default=5, type=click.IntRange(min=1), help='number of the largest errors to show for each mismatched variable'),
+                click.option('--dump_diff', type=click.Path(file_okay=False), help='folder to save the mismatched elements of each file pair (FILE.diff.h5)'),
+                click.option('--sample', callback=parse_sample, metavar='FRACTION|N', help='only compare a random FRACTION (or N) of the blocks (aligned to the storage chunks) of each variable, and compare all the data if any difference is found'),
+                click.option('--baseline_memory', default=1024, type=click.IntRange(min=0), help='maximum size (MB) of the data of file1 kept in memory, when it is compared with multiple "file2"'),
+                click.option('--max_memory', default=0, type=click.IntRange(min=0), help='memory limit (MB) to compare a variable; the larger variables are compared block by block, 0 for no limit'),
+                click.option('--block_size', default=64, type=click.IntRange(min=1), help='size (MB) of each block when reading a variable block by block'),
                 ]
 
 class TestBaseAttr(TestBaseGroup):
@@ -395,7 +1261,10 @@ class TestBaseAttr(TestBaseGroup):
     def test(self, file1, file2):
         TestBase.test(self, file1, file2)
 
-        match_data, match_attr = self.do_test(file1, file2)
+        try:
+            match_data, match_attr = self.do_test(file1, file2)
+        finally:
+            self.close_diff()
         if not match_data:
             self.mismatch_count += 1
 
@@ -414,6 +1283,22 @@ class TestBaseAttr(TestBaseGroup):
 
         return match_data
 
+    def get_record(self, file, match):
+        record = super().get_record(file, match)
+        record['match_attr'] = bool(self.match_attr)
+        return record
+
+    def restore_record(self, record):
+        super().restore_record(record)
+        if not record.get('match_attr', True):
+            self.mismatch_attr += 1
+            if self.stop_on_attr_mismatch:
+                self._stop = True
+
+    def reset_result(self):
+        super().reset_result()
+        self.mismatch_attr = 0
+
     def show_overall(self):
         super().show_overall()
         verbose = self.verbose if self.tqdm_mode else self.LOG_MAX
@@ -422,7 +1307,7 @@ class TestBaseAttr(TestBaseGroup):
     def load_config(self, **kwargs):
         kwargs = super().load_config(**kwargs)
         self.stop_on_attr_mismatch = kwargs.get('stop_on_attr_mismatch', self.stop_on_attr_mismatch)
-        self.ignore_attributes = kwargs.get('ignore_attr', [])
+        self.ignore_attributes = as_list(kwargs.get('ignore_attr', []))
         return kwargs
 
     def show_result(self):
@@ -432,26 +1317,33 @@ class TestBaseAttr(TestBaseGroup):
             self.error(f'{self.mismatch_attr}', verbose=self.LOG_MAX)
         else:
             self.success(f'{self.mismatch_attr}', verbose=self.LOG_MAX)
+        self.renderer.flush()
 
     @classmethod
     def run(cls, **kwargs):
         test = cls()
-        kwargs = test.load_config(**kwargs)
-        if kwargs['file1'] is None or kwargs['file2'] is None:
-            file = kwargs['file1'] or kwargs['file2']
-            if file is not None:
-                test.stat(file)
-        if kwargs['file1'] is not None and kwargs['file2'] is not None:
-            test.stop_on_mismatch = False
-            test.stop_on_attr_mismatch = False
-            if test.verbose == test.LOG_AUTO:
-                test.verbose = test.LOG_INFO
-            test.test(kwargs['file1'], kwargs['file2'])
-            test.show_result()
-        elif kwargs['folder1'] is not None and kwargs['folder2'] is not None:
-            if test.verbose == test.LOG_AUTO:
-                test.verbose = cls.LOG_NONE
-            test.test_all(kwargs['folder1'], kwargs['folder2'])
+        try:
+            kwargs = test.load_config(**kwargs)
+            if test.run_candidates(**kwargs):
+                return
+            if kwargs['file1'] is None or kwargs['file2'] is None:
+                file = kwargs['file1'] or kwargs['file2']
+                if file is not None:
+                    test.stat(file)
+            if kwargs['file1'] is not None and kwargs['file2'] is not None:
+                test.stop_on_mismatch = False
+                test.stop_on_attr_mismatch = False
+                test.current_file = os.path.basename(kwargs['file1'])
+                if test.verbose == test.LOG_AUTO:
+                    test.verbose = test.LOG_INFO
+                test.test(kwargs['file1'], kwargs['file2'])
+                test.show_result()
+            elif kwargs['folder1'] is not None and kwargs['folder2'] is not None:
+                if test.verbose == test.LOG_AUTO:
+                    test.verbose = cls.LOG_NONE
+                test.test_all(kwargs['folder1'], kwargs['folder2'])
+        finally:
+            test.renderer.flush()
 
     @classmethod
     def get_options(cls):
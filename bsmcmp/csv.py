@@ -14,7 +14,11 @@ class TestCSV(TestBaseGroup):
     def get_data(self, d):
         return np.asarray(d)
 
-    def check_group(self, group1, group2, indent=""):
+    def get_view(self, d):
+        # the column is already in memory
+        return np.asarray(d)
+
+    def check_group(self, group1, group2, indent="", path=""):
 
         # check data
         match_data = True
@@ -37,10 +41,11 @@ class TestCSV(TestBaseGroup):
 
             d1 = group1[k]
             d2 = group2[k]
+            name = f'{path}/{k}' if path else str(k)
             if isinstance(v, MutableMapping):
-                match_data = self.check_group(d1, d2, indent + '    ')
+                match_data = self.check_group(d1, d2, indent + '    ', name)
             else:
-                if not self.check_data(d1, d2, indent+'    '):
+                if not self.check_data(d1, d2, indent+'    ', name):
                     match_data = False
 
             self.end_message_delay()
@@ -75,7 +80,7 @@ class TestCSV(TestBaseGroup):
             match_data = False
         return match_data
 
-    def stat_group(self, group1, indent=""):
+    def stat_group(self, group1, indent="", path=""):
 
         # check data
         for k, v in group1.items():
@@ -88,10 +93,11 @@ class TestCSV(TestBaseGroup):
                 continue
 
             d1 = group1[k]
+            name = f'{path}/{k}' if path else str(k)
             if isinstance(v, MutableMapping):
-                self.stat_group(d1, indent + '    ')
+                self.stat_group(d1, indent + '    ', name)
             else:
-                self.stat_data(d1, indent+'    ')
+                self.stat_data(d1, indent+'    ', name)
 
             self.end_message_delay()
 
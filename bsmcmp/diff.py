@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import h5py
+
+
+class DiffWriter:
+    # save the mismatched elements of the variables to a HDF5 file as sparse
+    # (COO) datasets, block by block:
+    #   /<variable>/index: (n, ndim) index of the mismatched elements
+    #   /<variable>/d1, d2: the values from each file
+    #   /<variable>/error: abs(d1 - d2) (numeric data only)
+    CHUNK = 65536
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fp = None
+
+    def open(self):
+        if self._fp is None:
+            folder = os.path.dirname(self.filename)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._fp = h5py.File(self.filename, 'w')
+        return self._fp
+
+    def variable(self, name, shape):
+        return DiffVariable(self, name, shape)
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class DiffVariable:
+    def __init__(self, writer, name, shape):
+        self.writer = writer
+        self.name = name.strip('/') or 'data'
+        self.shape = tuple(shape)
+        self._group = None
+
+    def _append(self, key, data):
+        g = self._group
+        if key not in g:
+            chunks = (DiffWriter.CHUNK,) + data.shape[1:]
+            g.create_dataset(key, data=data, maxshape=(None,) + data.shape[1:],
+                             chunks=chunks, compression='gzip', shuffle=True)
+            return
+        ds = g[key]
+        n = ds.shape[0]
+        ds.resize(n + data.shape[0], axis=0)
+        ds[n:] = data
+
+    def write(self, mismatch, a, b, err=None, offset=None):
+        # only the mismatched elements are saved, so the file size is
+        # proportional to the differences
+        if self._group is None:
+            self._group = self.writer.open().require_group(self.name)
+            self._group.attrs['shape'] = self.shape
+        w = np.nonzero(mismatch)
+        index = np.stack(w, axis=-1).astype(np.int64)
+        if offset is not None:
+            index += np.asarray(offset, dtype=np.int64)
+        self._append('index', index)
+        for key, v in [('d1', a), ('d2', b), ('error', err)]:
+            if v is None:
+                continue
+            v = np.asarray(v)[w]
+            if v.dtype.kind in 'biufc':
+                self._append(key, v)
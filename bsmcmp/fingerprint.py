@@ -0,0 +1,100 @@
+import json
+import numpy as np
+import click
+
+from .base import TestBase, TestBaseGroup
+from .result import VariableResult
+
+
+class TestFingerprint(TestBaseGroup):
+    NAME = 'fingerprint'
+    EXT = '.fp.json'
+
+    def get_data(self, d):
+        return d
+
+    def check_data(self, d1, d2, indent='', name=None):
+        match = d1.get('checksum') == d2.get('checksum') and \
+                d1.get('dtype') == d2.get('dtype') and \
+                d1.get('shape') == d2.get('shape')
+        self.add_result(VariableResult(name, match, d1.get('shape'), d2.get('shape')))
+        if match:
+            self.success(f"{indent}data: ", fg=None, nl=False)
+            self.success("pass")
+            return match
+
+        self.error(f"{indent}data: ", fg=None, nl=False)
+        self.error("fail")
+        for key in ['dtype', 'shape', 'nan', 'min', 'max', 'sum']:
+            v1, v2 = d1.get(key), d2.get(key)
+            if v1 == v2:
+                continue
+            self.error(f"{indent}    {key:>5}: {v1} / {v2}", fg=None)
+        h1, h2 = d1.get('hist'), d2.get('hist')
+        if h1 is not None and h2 is not None and len(h1) == len(h2):
+            h1 = np.asarray(h1)
+            h2 = np.asarray(h2)
+            diff = np.sum(np.abs(h1 - h2)) / max(np.sum(h1) + np.sum(h2), 1)
+            self.error(f"{indent}     hist: {diff*100:.4f}% different", fg=None)
+        return match
+
+    def check_group(self, group1, group2, indent=""):
+
+        match_data = len(group1) == len(group2)
+        for k, v in group1.items():
+            self.start_message_delay()
+
+            self.error(k, fg=None)
+            if self.has_pattern(k, self.ignore_variables):
+                self.warning(f"{indent}    ignore")
+                self.end_message_delay()
+                continue
+
+            if k not in group2:
+                self.error(f'{indent}    not found in 2nd file')
+                match_data = False
+                self.end_message_delay()
+                continue
+
+            if not self.check_data(v, group2[k], indent+'    ', k):
+                match_data = False
+
+            self.end_message_delay()
+
+        for k in group2:
+            if k not in group1:
+                self.error(k, fg=None)
+                self.error(f'{indent}    not found in 1st file')
+                match_data = False
+
+        return match_data
+
+    def load(self, filename):
+        with open(filename, 'r', encoding='utf-8') as fp:
+            return json.load(fp)
+
+    def do_test(self, file1, file2):
+        f1 = self.load(file1)
+        f2 = self.load(file2)
+        if f1.get('format') != f2.get('format'):
+            self.error(f"different format: {f1.get('format')} / {f2.get('format')}")
+            return False
+        return self.check_group(f1['variables'], f2['variables'])
+
+    def do_stat(self, file):
+        f1 = self.load(file)
+        for k, v in f1['variables'].items():
+            self.error(k, fg='green')
+            for key, value in v.items():
+                self.error(f"    {key}: {value}", fg=None)
+
+    @classmethod
+    def get_options(cls):
+        return TestBase.get_options() + [
+                click.option('--ignore_var', multiple=True, help='variables to be ignored'),
+                ]
+
+
+@TestFingerprint.click_command()
+def test_fingerprint(**kwargs):
+    TestFingerprint.run(**kwargs)
@@ -13,6 +13,21 @@ class TestGeoTiff(TestBaseAttr):
     def get_data(self, d):
         return np.asarray(d[:].astype(np.float64))
 
+    def get_schema(self, d):
+        if not isinstance(d, rasterio.Band):
+            return super().get_schema(d)
+        ds, k = d.ds, d.bidx
+        return {'dtype': d.dtype, 'shape': d.shape,
+                'block_shape': ds.block_shapes[k-1],
+                'compression': ds.compression.value if ds.compression else None,
+                'nodata': ds.nodatavals[k-1]}
+
+    def read_band(self, ds, k):
+        if self.structure_only:
+            # no need to read the data
+            return rasterio.band(ds, k)
+        return ds.read(k)
+
     def check_group(self, group1, group2, indent=""):
 
         # check attribute
@@ -29,12 +44,15 @@ class TestGeoTiff(TestBaseAttr):
                     self.warning(f"{indent}    ignore")
                     self.end_message_delay()
                     continue
-                d1 = group1.read(k)
-                d2 = group2.read(k)
-                if not self.check_data(d1, d2, indent+'    '):
+                d1 = self.read_band(group1, k)
+                d2 = self.read_band(group2, k)
+                if not self.check_data(d1, d2, indent+'    ', f'band {k}'):
                     match_data = False
 
                 self.end_message_delay()
+        else:
+            match_data = False
+            self.error(f"{indent}band count: {group1.count} / {group2.count}")
 
         return match_data, match_attr
 
@@ -65,8 +83,8 @@ class TestGeoTiff(TestBaseAttr):
                 self.end_message_delay()
                 continue
 
-            d1 = group1.read(k)
-            self.stat_data(d1, indent+'    ')
+            d1 = self.read_band(group1, k)
+            self.stat_data(d1, indent+'    ', f'band {k}')
 
             self.end_message_delay()
 
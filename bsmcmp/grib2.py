@@ -1,21 +1,253 @@
+import os
+import glob
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 import xarray as xr
+import click
 
 from .base import TestBaseAttr
+from .stats import ErrorStat
+from .result import VariableResult
+
+
+class GribMessage:
+    # one GRIB message, with the same get_attrs/get_data interface as the
+    # xarray variable
+    KEYS = ['paramId', 'typeOfLevel', 'level', 'stepRange', 'validityDate', 'validityTime', 'number']
+    NAMESPACES = ['ls', 'parameter', 'time', 'geography', 'vertical', 'mars']
+
+    def __init__(self, message):
+        import eccodes
+        self.message = message
+        self.handle = eccodes.codes_new_from_message(message)
+        # the index key (including the ensemble number and the # of the
+        # duplicate), set when read by the index
+        self.key = None
+        self._attrs = None
+
+    @classmethod
+    def get_key(cls, handle):
+        import eccodes
+        key = []
+        for k in cls.KEYS:
+            try:
+                key.append(str(eccodes.codes_get(handle, k)))
+            except eccodes.CodesInternalError:
+                key.append('')
+        return tuple(key)
+
+    @classmethod
+    def iter_file(cls, filename):
+        # yield the key, offset and length of each message
+        import eccodes
+        with open(filename, 'rb') as fp:
+            while True:
+                h = eccodes.codes_grib_new_from_file(fp, headers_only=True)
+                if h is None:
+                    break
+                try:
+                    yield (cls.get_key(h), int(eccodes.codes_get(h, 'offset')),
+                           int(eccodes.codes_get(h, 'totalLength')))
+                finally:
+                    eccodes.codes_release(h)
+
+    @staticmethod
+    def read(fp, offset, length):
+        fp.seek(offset)
+        return fp.read(length)
+
+    def get(self, key, default=None):
+        import eccodes
+        try:
+            if eccodes.codes_get_size(self.handle, key) > 1:
+                return eccodes.codes_get_array(self.handle, key)
+            return eccodes.codes_get(self.handle, key)
+        except eccodes.CodesInternalError:
+            return default
+
+    @property
+    def name(self):
+        return (f"{self.get('shortName')} {self.get('typeOfLevel')}={self.get('level')} "
+                f"step={self.get('stepRange')} {self.get('validityDate')}/{self.get('validityTime'):04}")
+
+    @property
+    def attrs(self):
+        import eccodes
+        if self._attrs is None:
+            self._attrs = {}
+            for ns in self.NAMESPACES:
+                it = eccodes.codes_keys_iterator_new(self.handle, ns)
+                while eccodes.codes_keys_iterator_next(it):
+                    k = eccodes.codes_keys_iterator_get_name(it)
+                    if k not in self._attrs:
+                        v = self.get(k)
+                        # the multi-valued keys (e.g., pv, pl) as lists, so
+                        # the ones of different lengths are compared
+                        self._attrs[k] = v.tolist() if isinstance(v, np.ndarray) else v
+                eccodes.codes_keys_iterator_delete(it)
+        return self._attrs
+
+    def data_sections(self):
+        # the encoded data representation/bitmap/data (section 5, 6, 7) of GRIB2
+        if self.get('edition') != 2:
+            return None
+        start = self.get('offsetSection5')
+        end = self.get('offsetSection7') + self.get('section7Length')
+        return self.message[start:end]
+
+    def to_numpy(self):
+        import eccodes
+        values = eccodes.codes_get_values(self.handle).astype(np.float64)
+        if self.get('bitmapPresent'):
+            values[values == self.get('missingValue')] = np.nan
+        ni, nj = self.get('Ni'), self.get('Nj')
+        if isinstance(ni, int) and isinstance(nj, int) and ni > 0 and ni*nj == values.size:
+            values = values.reshape(nj, ni)
+        return values
+
+    def close(self):
+        import eccodes
+        if self.handle is not None:
+            eccodes.codes_release(self.handle)
+            self.handle = None
 
 
 class TestGRIB2(TestBaseAttr):
     NAME = 'grib'
     EXT = '.grib2'
 
+    def __init__(self):
+        super().__init__()
+        self.chunks = None
+        self.scheduler = 'threads'
+        self.num_workers = None
+        self.index = True
+        self.index_dir = None
+        self.messages = False
+
     def get_attrs(self, d):
         return d.attrs
 
     def get_data(self, d):
         return d.to_numpy()
 
+    def get_schema(self, d):
+        if isinstance(d, GribMessage):
+            return {k: d.get(k) for k in ['gridType', 'numberOfValues', 'packingType', 'bitsPerValue']}
+        schema = super().get_schema(d)
+        schema['dims'] = d.dims
+        return schema
+
+    def get_dims(self, d):
+        return getattr(d, 'dims', None)
+
+    def get_coord(self, d, dim):
+        if isinstance(d, xr.DataArray) and dim in d.coords and d.coords[dim].dims == (dim,):
+            return d.coords[dim].values
+        return None
+
+    def get_baseline_key(self, d, name):
+        if isinstance(d, GribMessage) and d.key is not None:
+            return d.key
+        return super().get_baseline_key(d, name)
+
+    def get_index_dir(self):
+        if self.index_dir:
+            return self.index_dir
+        cache = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(cache, 'bsmcmp', 'grib')
+
+    def get_indexpath(self, filename):
+        # keep the cfgrib index in the cache folder instead of next to the data;
+        # the name includes the mtime/size of the file, so the index will be
+        # rebuilt once the file changes
+        if not self.index:
+            return ''
+        index_dir = self.get_index_dir()
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+        except OSError:
+            return ''
+        filename = os.path.abspath(filename)
+        key = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:16]
+        st = os.stat(filename)
+        prefix = os.path.join(index_dir, key)
+        current = f'{prefix}-{st.st_mtime_ns}-{st.st_size}'
+        for idx in glob.glob(glob.escape(prefix) + '-*.idx'):
+            if not idx.startswith(current + '.'):
+                try:
+                    os.remove(idx)
+                except OSError:
+                    pass
+        return current + '.{short_hash}.idx'
+
+    def open_dataset(self, filename):
+        kwargs = {'engine': 'cfgrib',
+                  'backend_kwargs': {'indexpath': self.get_indexpath(filename)}}
+        if self.chunks is not None:
+            kwargs['chunks'] = self.chunks if self.chunks == 'auto' else int(self.chunks)
+        return xr.open_dataset(filename, **kwargs)
+
+    def check_data(self, d1, d2, indent='', name=None):
+        if self.align and not self.structure_only:
+            alignment = self.get_alignment(d1, d2)
+            if alignment is not None:
+                return self.check_data_aligned(d1, d2, alignment, indent, name)
+        if self.structure_only or getattr(d1, 'chunks', None) is None or \
+           getattr(d2, 'chunks', None) is None or not d1.shape:
+            return super().check_data(d1, d2, indent, name)
+        return self.check_data_lazy(d1, d2, indent, name)
+
+    def check_data_lazy(self, d1, d2, indent='', name=None):
+        # count the mismatches of each block lazily, and only read the
+        # mismatched blocks again
+        import dask
+        import dask.array as da
+
+        if d1.shape != d2.shape:
+            self.error(f"{indent}data: ", fg=None, nl=False)
+            self.error("fail")
+            self.error(f"{indent}    d1.shape: {d1.shape}", fg=None)
+            self.error(f"{indent}    d2.shape: {d2.shape}", fg=None)
+            self.add_result(VariableResult(name, False, d1.shape, d2.shape))
+            return False
+
+        a = d1.data
+        b = d2.data.rechunk(a.chunks)
+        inexact = np.issubdtype(a.dtype, np.inexact) and np.issubdtype(b.dtype, np.inexact)
+
+        def _count(x, y):
+            mismatch = x != y
+            if inexact:
+                mismatch &= ~(np.isnan(x) & np.isnan(y))
+            return np.full((1,)*x.ndim, np.count_nonzero(mismatch), dtype=np.int64)
+
+        # the # of mismatches of each block, the only data computed if the
+        # variables match
+        counts = da.map_blocks(_count, a, b, dtype=np.int64,
+                               chunks=tuple((1,)*n for n in a.numblocks))
+        counts = counts.compute(scheduler=self.scheduler, num_workers=self.num_workers)
+        if not counts.any():
+            self.add_result(VariableResult(name, True, d1.shape, d2.shape, 0, int(np.prod(a.shape))))
+            self.success(f"{indent}data: ", fg=None, nl=False)
+            self.success("pass")
+            return True
+
+        # fetch only the mismatched blocks, in one compute, and add the
+        # matched ones as equal
+        blocks = [tuple(i) for i in np.argwhere(counts)]
+        starts = [np.cumsum((0,) + c[:-1]) for c in a.chunks]
+        stat = ErrorStat(a.shape, self.top_k, self.get_diff(name, a.shape))
+        data = dask.compute(*[(a.blocks[i], b.blocks[i]) for i in blocks],
+                            scheduler=self.scheduler, num_workers=self.num_workers)
+        for i, (ba, bb) in zip(blocks, data):
+            stat.update(ba, bb, [s[j] for s, j in zip(starts, i)], mismatched=True)
+        stat.add_equal(int(np.prod(a.shape)) - sum(int(np.prod(ba.shape)) for ba, _ in data))
+        return self.show_stat(stat, indent, name)
+
     def check_group(self, group1, group2, indent=""):
 
         # check attribute
@@ -41,7 +273,7 @@ class TestGRIB2(TestBaseAttr):
 
             d1 = group1[k]
             d2 = group2[k]
-            if not self.check_data(d1, d2, indent+'    '):
+            if not self.check_data(d1, d2, indent+'    ', k):
                 match_data = False
 
             if not self.check_attr(d1, d2, indent+'    '):
@@ -57,10 +289,81 @@ class TestGRIB2(TestBaseAttr):
 
         return match_data, match_attr
 
+    def check_messages(self, file1, file2, indent=""):
+        # compare the messages one by one (keyed by paramId, level, step, etc),
+        # so the messages in different hypercubes are all compared
+
+        def _index(filename):
+            index, count = {}, {}
+            for key, offset, length in GribMessage.iter_file(filename):
+                # the duplicated messages are compared in order
+                n = count.get(key, 0)
+                count[key] = n + 1
+                index[key + (n,)] = (offset, length)
+            return index
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            index1, index2 = executor.map(_index, [file1, file2])
+
+        match_data = len(index1) == len(index2)
+        match_attr = True
+        with open(file1, 'rb') as fp1, open(file2, 'rb') as fp2:
+            for key, (offset, length) in index1.items():
+                self.start_message_delay()
+
+                m1 = GribMessage(GribMessage.read(fp1, offset, length))
+                m1.key = key
+                self.error(m1.name, fg=None)
+                if self.has_pattern(m1.name, self.ignore_variables):
+                    self.warning(f"{indent}    ignore")
+                    m1.close()
+                    self.end_message_delay()
+                    continue
+
+                if key not in index2:
+                    self.error(f'{indent}    not found in 2nd file')
+                    match_data = False
+                    m1.close()
+                    self.end_message_delay()
+                    continue
+
+                m2 = GribMessage(GribMessage.read(fp2, *index2[key]))
+                if m1.message == m2.message and not self.structure_only:
+                    # identical message, no need to decode
+                    self.success(f"{indent}    message: ", fg=None, nl=False)
+                    self.success("pass")
+                else:
+                    s1 = None if self.structure_only else m1.data_sections()
+                    if s1 is not None and s1 == m2.data_sections():
+                        self.success(f"{indent}    data: ", fg=None, nl=False)
+                        self.success("pass")
+                    elif not self.check_data(m1, m2, indent+'    ', m1.name):
+                        match_data = False
+
+                    if not self.check_attr(m1, m2, indent+'    '):
+                        match_attr = False
+                m1.close()
+                m2.close()
+
+                self.end_message_delay()
+
+            for key, (offset, length) in index2.items():
+                if key not in index1:
+                    m2 = GribMessage(GribMessage.read(fp2, offset, length))
+                    self.error(m2.name, fg=None)
+                    self.error(f'{indent}    not found in 1st file')
+                    m2.close()
+                    match_data = False
+
+        return match_data, match_attr
+
     def do_test(self, file1, file2):
+        if self.messages:
+            return self.check_messages(file1, file2)
 
-        f1 = xr.open_dataset(file1)
-        f2 = xr.open_dataset(file2)
+        # scan/load the index of both files at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            f1, f2 = executor.map(self.open_dataset, [file1, file2])
         match_data, match_attr = self.check_group(f1, f2)
         f1.close()
         f2.close()
@@ -82,18 +385,59 @@ class TestGRIB2(TestBaseAttr):
                 continue
 
             d1 = group1[k]
-            self.stat_data(d1, indent+'    ')
+            self.stat_data(d1, indent+'    ', k)
 
             self.stat_attr(d1, indent+'    ')
 
             self.end_message_delay()
 
+    def stat_messages(self, file, indent=""):
+        with open(file, 'rb') as fp:
+            for _, offset, length in GribMessage.iter_file(file):
+                self.start_message_delay()
+
+                m1 = GribMessage(GribMessage.read(fp, offset, length))
+                self.error(m1.name, fg='green')
+                if self.has_pattern(m1.name, self.ignore_variables):
+                    self.warning(f"{indent}    ignore")
+                else:
+                    self.stat_data(m1, indent+'    ', m1.name)
+                    self.stat_attr(m1, indent+'    ')
+                m1.close()
+
+                self.end_message_delay()
+
     def do_stat(self, file):
+        if self.messages:
+            self.stat_messages(file)
+            return
 
-        f1 = xr.open_dataset(file)
+        f1 = self.open_dataset(file)
         self.stat_group(f1)
         f1.close()
 
+    def load_config(self, **kwargs):
+        kwargs = super().load_config(**kwargs)
+        self.chunks = kwargs.get('chunks', self.chunks)
+        self.scheduler = kwargs.get('scheduler', self.scheduler)
+        self.num_workers = kwargs.get('num_workers', self.num_workers)
+        self.index = kwargs.get('index', self.index)
+        self.index_dir = kwargs.get('index_dir', self.index_dir)
+        self.messages = kwargs.get('messages', self.messages)
+        return kwargs
+
+    @classmethod
+    def get_options(cls):
+        return super().get_options() + [
+                click.option('--chunks', help='open the files with dask chunks ("auto" or the chunk size), and compare the variables chunk by chunk'),
+                click.option('--scheduler', default='threads', type=click.Choice(['threads', 'processes', 'synchronous']), help='the dask scheduler to compare the chunks'),
+                click.option('--num_workers', type=click.IntRange(min=1), help='number of the dask workers'),
+                click.option('--index/--no-index', is_flag=True, default=True, help='save the GRIB index to "index_dir", and reuse it in the next run'),
+                click.option('--messages', is_flag=True, default=False, help='compare the GRIB messages one by one (keyed by paramId, typeOfLevel, level, step, valid time and ensemble number) instead of the xarray dataset'),
+                click.option('--align', is_flag=True, default=False, help='align the variables by the dimension names and coordinate values (e.g., transposed, reversed or a subset), and compare the overlapping region'),
+                click.option('--index_dir', type=click.Path(file_okay=False), help='folder to save the GRIB index [default: ~/.cache/bsmcmp/grib]'),
+                ]
+
 
 @TestGRIB2.click_command()
 def test_grib2(**kwargs):
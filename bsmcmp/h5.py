@@ -1,5 +1,7 @@
+import os
 import numpy as np
 import h5py
+import click
 
 from .base import TestBaseAttr
 
@@ -7,13 +9,109 @@ from .base import TestBaseAttr
 class TestHDF5(TestBaseAttr):
     NAME = 'HDF5'
     EXT = '.h5'
+    # h5py serializes all the calls with a global lock
+    CONCURRENT_READ = False
+    # the default chunk cache (bytes) of HDF5
+    CHUNK_CACHE = 1024*1024
+    # the smaller datasets are faster to read than to map
+    MMAP_MIN_SIZE = 1024*1024
+
+    def __init__(self):
+        super().__init__()
+        self.mmap = True
+        # filename -> file descriptor for readahead
+        self._fds = {}
 
     def get_attrs(self, d):
         return d.attrs
 
     def get_data(self, d):
+        if self.mmap and isinstance(d, h5py.Dataset):
+            data = self.mmap_data(d)
+            if data is not None:
+                return data
         return np.asarray(d)
 
+    def get_schema(self, d):
+        schema = super().get_schema(d)
+        if isinstance(d, h5py.Dataset):
+            schema.update({'maxshape': d.maxshape, 'chunks': d.chunks,
+                           'compression': d.compression, 'compression_opts': d.compression_opts,
+                           'shuffle': d.shuffle, 'fletcher32': d.fletcher32,
+                           'scaleoffset': d.scaleoffset, 'fillvalue': d.fillvalue})
+        return schema
+
+    def set_chunk_cache(self, d, nbytes):
+        # the chunk cache is set when the dataset is opened
+        if not nbytes or not isinstance(d, h5py.Dataset) or d.chunks is None:
+            return d
+        nbytes = max(nbytes, self.CHUNK_CACHE)
+        n_chunks = nbytes // max(1, int(np.prod(d.chunks))*d.dtype.itemsize)
+        dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+        # preempt the fully read chunks first
+        dapl.set_chunk_cache(max(521, 100*n_chunks + 1), nbytes, 1.0)
+        return h5py.Dataset(h5py.h5d.open(d.file.id, d.name.encode(), dapl))
+
+    def get_view(self, d):
+        if self.mmap and isinstance(d, h5py.Dataset):
+            data = self.mmap_data(d)
+            if data is not None:
+                return data
+        return d
+
+    def mmap_data(self, d):
+        # the raw data of a contiguous (not chunked, so no filter) dataset is
+        # stored at a fixed offset, map it directly instead of copying
+        if d.chunks is not None or d.external or not d.shape or d.size == 0:
+            return None
+        if d.dtype.kind not in 'biufc' or d.dtype.fields is not None:
+            return None
+        if d.size*d.dtype.itemsize < self.MMAP_MIN_SIZE:
+            return None
+        if d.file.driver != 'sec2':
+            return None
+        offset = d.id.get_offset()
+        if offset is None:
+            # not allocated yet
+            return None
+        return np.memmap(d.file.filename, dtype=d.dtype, mode='r', offset=offset, shape=d.shape)
+
+    def get_extents(self, d):
+        # (offset, size) of the data of the dataset in the file
+        try:
+            if d.chunks is None:
+                offset = d.id.get_offset()
+                if offset is not None:
+                    yield offset, d.id.get_storage_size()
+                return
+            for i in range(d.id.get_num_chunks()):
+                info = d.id.get_chunk_info(i)
+                yield info.byte_offset, info.size
+        except (AttributeError, RuntimeError, ValueError):
+            # e.g., the chunk query is not supported by the HDF5 library
+            return
+
+    def readahead(self, *ds):
+        if self.prefetch <= 0 or not hasattr(os, 'posix_fadvise'):
+            return
+        for d in ds:
+            if not isinstance(d, h5py.Dataset) or d.file.driver != 'sec2':
+                continue
+            filename = d.file.filename
+            if filename not in self._fds:
+                self._fds[filename] = os.open(filename, os.O_RDONLY)
+            budget = self.prefetch_memory*1024*1024
+            for offset, size in self.get_extents(d):
+                os.posix_fadvise(self._fds[filename], offset, size, os.POSIX_FADV_WILLNEED)
+                budget -= size
+                if budget <= 0:
+                    break
+
+    def close_fds(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
     def check_group(self, group1, group2, indent=""):
 
         # check attribute
@@ -22,9 +120,18 @@ class TestHDF5(TestBaseAttr):
         # check data and its attributes
         match_data = True
         match_data = len(group1) == len(group2)
-        for k, v in group1.items():
+        keys = list(group1.keys())
+        for i, (k, v) in enumerate(group1.items()):
             self.start_message_delay()
 
+            # file2 of this dataset and both sides of the next one are read
+            # by the OS while this one is compared
+            if self.prefetch > 0 and isinstance(v, h5py.Dataset):
+                ahead = [group2.get(k)]
+                if i + 1 < len(keys):
+                    ahead += [group1.get(keys[i + 1]), group2.get(keys[i + 1])]
+                self.readahead(*ahead)
+
             self.error(k, fg=None)
             if self.has_pattern(k, self.ignore_variables):
                 self.warning(f"{indent}    ignore")
@@ -42,7 +149,7 @@ class TestHDF5(TestBaseAttr):
             if isinstance(v, h5py.Group):
                 match_data, match_attr = self.check_group(d1, d2, indent + '    ')
             elif isinstance(v, h5py.Dataset):
-                if not self.check_data(d1, d2, indent+'    '):
+                if not self.check_data(d1, d2, indent+'    ', v.name):
                     match_data = False
 
                 if not self.check_attr(d1, d2, indent+'    '):
@@ -62,7 +169,10 @@ class TestHDF5(TestBaseAttr):
 
         f1 = h5py.File(file1)
         f2 = h5py.File(file2)
-        match_data, match_attr = self.check_group(f1, f2)
+        try:
+            match_data, match_attr = self.check_group(f1, f2)
+        finally:
+            self.close_fds()
         f1.close()
         f2.close()
         return match_data, match_attr
@@ -86,7 +196,7 @@ class TestHDF5(TestBaseAttr):
             if isinstance(v, h5py.Group):
                 self.stat_group(d1, indent + '    ')
             elif isinstance(v, h5py.Dataset):
-                self.stat_data(d1, indent+'    ')
+                self.stat_data(d1, indent+'    ', v.name)
 
                 self.stat_attr(d1, indent+'    ')
 
@@ -98,6 +208,17 @@ class TestHDF5(TestBaseAttr):
         self.stat_group(f1)
         f1.close()
 
+    def load_config(self, **kwargs):
+        kwargs = super().load_config(**kwargs)
+        self.mmap = kwargs.get('mmap', self.mmap)
+        return kwargs
+
+    @classmethod
+    def get_options(cls):
+        return super().get_options() + [
+                click.option('--mmap/--no-mmap', is_flag=True, default=True, help='memory-map the contiguous datasets instead of reading them'),
+                ]
+
 
 @TestHDF5.click_command()
 def test_h5(**kwargs):
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+
+
+class Journal:
+    # one json record per line; the optional header (e.g., the folders
+    # compared) is the first line, which is not a record
+    def __init__(self, filename, header=None, fresh=False, batch_size=32, batch_interval=5.0):
+        self.filename = filename
+        self.header = header
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        if fresh and os.path.isfile(filename):
+            os.remove(filename)
+        self.records = self.load(filename)
+        self._fp = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    @staticmethod
+    def load(filename):
+        records = {}
+        if not os.path.isfile(filename):
+            return records
+        with open(filename, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may be truncated if the previous run was killed
+                    continue
+                if isinstance(record, dict) and 'file' in record:
+                    records[record['file']] = record
+        return records
+
+    @staticmethod
+    def load_header(filename):
+        # the header of the journal, or None
+        if not os.path.isfile(filename):
+            return None
+        with open(filename, 'r', encoding='utf-8') as fp:
+            try:
+                record = json.loads(fp.readline())
+            except ValueError:
+                return None
+        return record.get('header') if isinstance(record, dict) else None
+
+    def open(self):
+        if self._fp is not None:
+            return
+        need_nl = False
+        empty = not os.path.isfile(self.filename) or os.path.getsize(self.filename) == 0
+        if not empty:
+            with open(self.filename, 'rb') as fp:
+                fp.seek(-1, os.SEEK_END)
+                need_nl = fp.read(1) != b'\n'
+        self._fp = open(self.filename, 'a', encoding='utf-8')
+        if need_nl:
+            # terminate the truncated record, so it will be ignored by load()
+            self._fp.write('\n')
+        if empty and self.header is not None:
+            self._fp.write(json.dumps({'header': self.header}) + '\n')
+            self._fp.flush()
+
+    def write(self, record):
+        self.open()
+        self._fp.write(json.dumps(record) + '\n')
+        self.records[record['file']] = record
+        self._pending += 1
+        if self._pending >= self.batch_size or \
+           time.monotonic() - self._last_sync >= self.batch_interval:
+            self.sync()
+
+    def sync(self):
+        if self._fp is None or self._pending == 0:
+            return
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._fp is None:
+            return
+        self.sync()
+        self._fp.close()
+        self._fp = None
+
+    def __contains__(self, file):
+        return file in self.records
+
+    def __getitem__(self, file):
+        return self.records[file]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
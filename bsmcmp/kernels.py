@@ -0,0 +1,76 @@
+import os
+import numpy as np
+
+# set BSMCMP_NUMBA=0 to always use numpy; numba is only imported when a
+# kernel is first used
+ENABLED = os.environ.get('BSMCMP_NUMBA', '1') != '0'
+# the smaller arrays are not worth the compilation (once per dtype)
+MIN_SIZE = 1 << 20
+# the dtypes numba compiles (e.g., not float16)
+DTYPES = {np.dtype(t) for t in ('f4', 'f8', 'i1', 'i2', 'i4', 'i8', 'u1', 'u2', 'u4', 'u8')}
+_impl = None
+
+
+def load():
+    # the numba kernels module, or None if disabled or not installed
+    global ENABLED, _impl
+    if ENABLED and _impl is None:
+        try:
+            from . import _numba_kernels
+            _impl = _numba_kernels
+        except ImportError:
+            ENABLED = False
+    return _impl if ENABLED else None
+
+
+def supported(a, b):
+    return ENABLED and a.shape == b.shape and a.size >= MIN_SIZE and \
+           a.dtype in DTYPES and b.dtype in DTYPES and load() is not None
+
+
+def _flat(a):
+    return np.ascontiguousarray(a).reshape(-1)
+
+
+def array_equal(a, b):
+    # nan is equal to nan for the numeric data
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if supported(a, b):
+        return bool(_impl.array_equal(_flat(a), _flat(b), _impl.n_blocks(a.size)))
+    return np.array_equal(a, b, equal_nan=np.issubdtype(a.dtype, np.number))
+
+
+def error_stats(a, b):
+    """
+    the statistics of the error abs(a - b) in one pass, without any temporary
+    array, or None if not supported (e.g., numba is not installed)
+
+    return dict with n_mismatch, n_zero, n_nan (the error is nan), n (not nan),
+    mean, m2 (sum of the squared deviations), min and max
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if not supported(a, b):
+        return None
+    counts, stats = _impl.error_stats(_flat(a), _flat(b), _impl.n_blocks(a.size))
+    r = {'n_mismatch': 0, 'n_zero': 0, 'n_nan': 0, 'n': 0, 'mean': 0.0, 'm2': 0.0,
+         'min': np.nan, 'max': np.nan}
+    for (n_mismatch, n, n_zero, n_nan), (mean, m2, vmin, vmax) in zip(counts, stats):
+        r['n_mismatch'] += int(n_mismatch)
+        r['n_zero'] += int(n_zero)
+        r['n_nan'] += int(n_nan)
+        if n == 0:
+            continue
+        if r['n'] == 0:
+            r.update(mean=mean, m2=m2, min=vmin, max=vmax)
+        else:
+            # Chan's parallel algorithm, same as StreamStat
+            total = r['n'] + n
+            delta = mean - r['mean']
+            r['mean'] += delta*n/total
+            r['m2'] += m2 + delta*delta*r['n']*n/total
+            r['min'] = min(r['min'], vmin)
+            r['max'] = max(r['max'], vmax)
+        r['n'] += int(n)
+    return r
@@ -10,9 +10,48 @@ class TestMat(TestBaseGroup):
     NAME = 'matlab'
     EXT = '.mat'
 
+    def __init__(self):
+        super().__init__()
+        self._files = []
+
     def get_data(self, d):
         return np.asarray(d)
 
+    def get_schema(self, d):
+        if isinstance(d, tuple):
+            # (shape, class) from whosmat
+            return {'shape': d[0], 'class': d[1]}
+        schema = super().get_schema(d)
+        if isinstance(d, h5py.Dataset):
+            cls = d.attrs.get('MATLAB_class', '')
+            schema['class'] = cls.decode() if isinstance(cls, bytes) else cls
+            schema['chunks'] = d.chunks
+            schema['compression'] = d.compression
+        return schema
+
+    def load_structure(self, filename):
+        # the variables without reading the data
+        try:
+            return {name: (shape, cls) for name, shape, cls in io.whosmat(filename)}
+        except:
+            pass
+
+        def _walk(g):
+            return {k: _walk(v) if isinstance(v, h5py.Group) else v
+                    for k, v in g.items() if not k.startswith('#')}
+        try:
+            fp = h5py.File(filename, 'r')
+        except:
+            self.error(f"failed to open {filename}")
+            return None
+        self._files.append(fp)
+        return _walk(fp)
+
+    def close_structure(self):
+        for fp in self._files:
+            fp.close()
+        self._files = []
+
     def process_record(self, d):
         if hasattr(d, 'keys'):
             keys = [k for k in d.keys() if not k.startswith('__')]
@@ -36,7 +75,7 @@ class TestMat(TestBaseGroup):
             data[name] = self.process_record(d[name])
         return data
 
-    def check_group(self, group1, group2, indent=""):
+    def check_group(self, group1, group2, indent="", path=""):
 
         # check data
         match_data = True
@@ -59,10 +98,11 @@ class TestMat(TestBaseGroup):
 
             d1 = group1[k]
             d2 = group2[k]
+            name = f'{path}/{k}' if path else str(k)
             if isinstance(v, MutableMapping):
-                match_data = self.check_group(d1, d2, indent + '    ')
+                match_data = self.check_group(d1, d2, indent + '    ', name)
             else:
-                if not self.check_data(d1, d2, indent+'    '):
+                if not self.check_data(d1, d2, indent+'    ', name):
                     match_data = False
 
             self.end_message_delay()
@@ -76,6 +116,16 @@ class TestMat(TestBaseGroup):
         return match_data
 
     def do_test(self, file1, file2):
+        if self.structure_only:
+            f1 = self.load_structure(file1)
+            f2 = self.load_structure(file2)
+            if f1 is not None and f2 is not None:
+                match_data = self.check_group(f1, f2)
+            else:
+                match_data = False
+            self.close_structure()
+            return match_data
+
         def _load(filename):
             raw = None
             try:
@@ -103,7 +153,7 @@ class TestMat(TestBaseGroup):
         _close(f2)
         return match_data
 
-    def stat_group(self, group1, indent=""):
+    def stat_group(self, group1, indent="", path=""):
 
         for k, v in group1.items():
             self.start_message_delay()
@@ -115,14 +165,22 @@ class TestMat(TestBaseGroup):
                 continue
 
             d1 = group1[k]
+            name = f'{path}/{k}' if path else str(k)
             if isinstance(v, MutableMapping):
-                self.stat_group(d1, indent + '    ')
+                self.stat_group(d1, indent + '    ', name)
             else:
-                self.stat_data(d1, indent+'    ')
+                self.stat_data(d1, indent+'    ', name)
 
             self.end_message_delay()
 
     def do_stat(self, file):
+        if self.structure_only:
+            f1 = self.load_structure(file)
+            if f1 is not None:
+                self.stat_group(f1)
+            self.close_structure()
+            return
+
         def _load(filename):
             raw = None
             try:
@@ -0,0 +1,27 @@
+import click
+
+from .base import TestBase, TestBaseAttr
+from .journal import Journal
+
+
+@click.command('merge', context_settings={'show_default': True})
+@click.argument('results', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('-v', '--verbose', count=True, help='show the mismatched files')
+def merge_result(results, verbose):
+    """Merge the results from "--shard" (or "--resume") runs into one report."""
+    records = {}
+    for result in results:
+        records.update(Journal.load(result))
+
+    if any('match_attr' in r for r in records.values()):
+        test = TestBaseAttr()
+    else:
+        test = TestBase()
+    test.stop_on_mismatch = False
+    test.verbose = TestBase.LOG_ERROR if verbose else TestBase.LOG_NONE
+    for file in sorted(records):
+        record = records[file]
+        test.restore_record(record)
+        if not record['match'] or not record.get('match_attr', True):
+            test.error(file, fg=None)
+    test.show_result()
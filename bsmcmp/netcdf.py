@@ -1,12 +1,27 @@
 import numpy as np
 import netCDF4
 from netCDF4 import Dataset
+from scipy.io import netcdf_file
+import click
 
 from .base import TestBaseAttr
 
 class TestNetcdf(TestBaseAttr):
     NAME = 'netCDF'
     EXT = '.nc'
+    # netCDF-C library is not thread-safe
+    CONCURRENT_READ = False
+    # the attributes netCDF4 uses to mask/scale the data
+    MASK_SCALE_ATTRS = ['scale_factor', 'add_offset', '_FillValue', 'missing_value',
+                        'valid_min', 'valid_max', 'valid_range', '_Unsigned']
+    # elements to check for the fill value at a time
+    FILL_BLOCK = 1024*1024
+
+    def __init__(self):
+        super().__init__()
+        self.mmap = True
+        self._mmap_files = {}
+        self._has_fill = {}
 
     def get_attrs(self, d):
         attrs = {}
@@ -15,7 +30,105 @@ class TestNetcdf(TestBaseAttr):
         return attrs
 
     def get_data(self, d):
-        return np.asarray(d[:].astype(np.float64).filled(np.nan))
+        if self.mmap and isinstance(d, netCDF4.Variable):
+            data = self.mmap_data(d)
+            if data is not None:
+                return data
+        return np.asarray(np.ma.filled(d[:].astype(np.float64), np.nan))
+
+    def get_schema(self, d):
+        schema = super().get_schema(d)
+        if isinstance(d, netCDF4.Variable):
+            schema.update({'dimensions': d.dimensions, 'chunking': d.chunking(),
+                           'filters': d.filters()})
+        return schema
+
+    def get_dims(self, d):
+        if isinstance(d, netCDF4.Variable):
+            return d.dimensions
+        return None
+
+    def get_coord(self, d, dim):
+        # the coordinate variable in the group of the variable or its parents
+        g = d.group()
+        while g is not None:
+            c = g.variables.get(dim)
+            if c is not None and c.dimensions == (dim,):
+                return np.asarray(c[:])
+            g = g.parent
+        return None
+
+    def get_chunks(self, d):
+        if isinstance(d, netCDF4.Variable):
+            chunking = d.chunking()
+            return tuple(chunking) if isinstance(chunking, list) else None
+        return super().get_chunks(d)
+
+    def set_chunk_cache(self, d, nbytes):
+        if not nbytes or not isinstance(d, netCDF4.Variable) or d.chunking() == 'contiguous':
+            return d
+        size, nelems, _ = d.get_var_chunk_cache()
+        if nbytes > size:
+            # preempt the fully read chunks first
+            d.set_var_chunk_cache(size=nbytes, nelems=max(nelems, 1009), preemption=1.0)
+        return d
+
+    def get_view(self, d):
+        if self.mmap and isinstance(d, netCDF4.Variable):
+            data = self.mmap_data(d)
+            if data is not None:
+                return data
+        return d
+
+    def mmap_data(self, d):
+        # the variables in netCDF3 classic file are stored uncompressed at the
+        # offset in the header, map the floating point ones directly if no
+        # mask/scale is needed, and the default fill value (masked by netCDF4,
+        # e.g., the unwritten records) is not in the data
+        g = d.group()
+        if g.data_model not in ('NETCDF3_CLASSIC', 'NETCDF3_64BIT_OFFSET'):
+            return None
+        if d.dtype.kind != 'f' or not d.shape or d.size == 0:
+            return None
+        if any(att in d.ncattrs() for att in self.MASK_SCALE_ATTRS):
+            return None
+        filename = g.filepath()
+        if filename not in self._mmap_files:
+            try:
+                self._mmap_files[filename] = netcdf_file(filename, 'r', mmap=True, maskandscale=False)
+            except:
+                self._mmap_files[filename] = None
+        nc = self._mmap_files[filename]
+        if nc is None or d.name not in nc.variables:
+            return None
+        data = nc.variables[d.name].data
+        if data.shape != d.shape:
+            return None
+        key = (filename, d.name)
+        if key not in self._has_fill:
+            self._has_fill[key] = self.has_fill(data)
+        if self._has_fill[key]:
+            return None
+        return data
+
+    def has_fill(self, data):
+        # whether the default fill value is in the data, block by block
+        fill = netCDF4.default_fillvals[data.dtype.str[1:]]
+        flat = data.reshape(-1)
+        for i in range(0, flat.size, self.FILL_BLOCK):
+            if np.any(flat[i:i+self.FILL_BLOCK] == fill):
+                return True
+        return False
+
+    def close_mmap(self):
+        for nc in self._mmap_files.values():
+            if nc is not None:
+                try:
+                    nc.close()
+                except:
+                    pass
+        self._mmap_files = {}
+        self._has_fill = {}
 
     def check_group(self, group1, group2, indent=""):
 
@@ -44,7 +157,7 @@ class TestNetcdf(TestBaseAttr):
             d2 = group2.variables[k]
             if not self.check_attr(d1, d2, indent+'    '):
                 match_attr = False
-            if not self.check_data(d1, d2, indent+'    '):
+            if not self.check_data(d1, d2, indent+'    ', f"{group1.path.rstrip('/')}/{k}"):
                 match_data = False
 
             self.end_message_delay()
@@ -73,6 +186,7 @@ class TestNetcdf(TestBaseAttr):
         nc_p = Dataset(file1)
         nc_m = Dataset(file2)
         match_data, match_attr = self.check_group(nc_p, nc_m)
+        self.close_mmap()
         nc_p.close()
         nc_m.close()
         return match_data, match_attr
@@ -80,6 +194,7 @@ class TestNetcdf(TestBaseAttr):
     def do_stat(self, file):
         nc_p = Dataset(file)
         self.stat_group(nc_p)
+        self.close_mmap()
 
     def stat_group(self, group1, indent=""):
 
@@ -98,13 +213,24 @@ class TestNetcdf(TestBaseAttr):
 
             d1 = group1.variables[k]
             self.stat_attr(d1, indent+'    ')
-            self.stat_data(d1, indent+'    ')
+            self.stat_data(d1, indent+'    ', f"{group1.path.rstrip('/')}/{k}")
 
             self.end_message_delay()
 
         for k, g in group1.groups.items():
             self.stat_group(g, indent+'    ')
 
+    def load_config(self, **kwargs):
+        kwargs = super().load_config(**kwargs)
+        self.mmap = kwargs.get('mmap', self.mmap)
+        return kwargs
+
+    @classmethod
+    def get_options(cls):
+        return super().get_options() + [
+                click.option('--mmap/--no-mmap', is_flag=True, default=True, help='memory-map the floating point variables in netCDF3 classic files instead of reading them'),
+                click.option('--align', is_flag=True, default=False, help='align the variables by the dimension names and coordinate values (e.g., transposed, reversed or a subset), and compare the overlapping region'),
+                ]
 
 
 @TestNetcdf.click_command()
@@ -0,0 +1,83 @@
+import os
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+
+class Prefetcher:
+    # read the files of the next few items in background threads, so they are
+    # (mostly) in the OS page cache by the time they are compared
+    BLOCK_SIZE = 4*1024*1024
+
+    def __init__(self, depth=2, max_memory=1024*1024*1024):
+        self.depth = depth
+        self.max_memory = max_memory
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executor = None
+
+    def _size(self, files):
+        size = 0
+        for f in files:
+            try:
+                size += os.path.getsize(f)
+            except OSError:
+                pass
+        return size
+
+    def _read(self, files):
+        buf = bytearray(self.BLOCK_SIZE)
+        for f in files:
+            try:
+                with open(f, 'rb', buffering=0) as fp:
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                    while not self._stop.is_set() and fp.readinto(buf):
+                        pass
+            except OSError:
+                pass
+
+    def _submit(self, files):
+        size = self._size(files)
+        with self._lock:
+            if not files or self._in_flight + size > self.max_memory:
+                # over budget, it will be read when being compared
+                return 0
+            self._in_flight += size
+        self._executor.submit(self._read, files)
+        return size
+
+    def _release(self, size):
+        with self._lock:
+            self._in_flight -= size
+
+    def iter(self, items, get_files):
+        # yield the items, and prefetch the files (get_files(item)) of the
+        # next "depth" items in the background
+        if self.depth <= 0:
+            yield from items
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.depth,
+                                            thread_name_prefix='prefetch')
+        pending = collections.deque()
+        items = iter(items)
+        try:
+            while True:
+                while len(pending) < self.depth + 1:
+                    item = next(items, _END)
+                    if item is _END:
+                        break
+                    pending.append((item, self._submit(get_files(item))))
+                if not pending:
+                    break
+                item, size = pending.popleft()
+                yield item
+                self._release(size)
+        finally:
+            self._stop.set()
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
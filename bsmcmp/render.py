@@ -0,0 +1,67 @@
+import sys
+import time
+import atexit
+import click
+import tqdm
+
+
+class Renderer:
+    # the messages are formatted once, buffered, and written in blocks
+    BUFFER_SIZE = 64*1024
+    # seconds, write the buffer at least this often, so the output is still
+    # interactive
+    INTERVAL = 0.2
+
+    def __init__(self, stream=None, color=None):
+        self._stream = stream
+        # None to style the messages only if the output is a terminal
+        self.color = color
+        self._buf = []
+        self._size = 0
+        self._last = time.monotonic()
+
+    @property
+    def stream(self):
+        # sys.stdout may be replaced after the renderer is created
+        return self._stream or sys.stdout
+
+    def use_color(self):
+        if self.color is not None:
+            return self.color
+        isatty = getattr(self.stream, 'isatty', None)
+        return bool(isatty and isatty())
+
+    def format(self, message='', nl=True, **styles):
+        text = str(message)
+        if self.use_color() and any(v is not None for v in styles.values()):
+            text = click.style(text, **styles)
+        return text + '\n' if nl else text
+
+    def write(self, text):
+        self._buf.append(text)
+        self._size += len(text)
+        if self._size >= self.BUFFER_SIZE or time.monotonic() - self._last >= self.INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._buf:
+            block = ''.join(self._buf)
+            self._buf = []
+            self._size = 0
+            stream = self.stream
+            # clear the progress bar (if any) once for the whole block
+            with tqdm.tqdm.external_write_mode(file=stream):
+                stream.write(block)
+                stream.flush()
+        self._last = time.monotonic()
+
+
+_renderer = None
+def get_renderer():
+    # the renderer of stdout shared by all the tests in the process, which
+    # is flushed at exit
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+        atexit.register(_renderer.flush)
+    return _renderer
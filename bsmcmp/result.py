@@ -0,0 +1,86 @@
+def _plain(v):
+    # convert numpy types to python types, e.g., for json
+    if isinstance(v, (list, tuple)):
+        return [_plain(x) for x in v]
+    if hasattr(v, 'tolist'):
+        return v.tolist()
+    if isinstance(v, bytes):
+        return v.decode(errors='replace')
+    return v
+
+
+class VariableResult:
+    # the comparison result of one variable
+    def __init__(self, name, match, shape1=None, shape2=None, n_mismatch=None,
+                 size=None, max_error=None, avg_error=None, std_error=None,
+                 top=None, region=None):
+        self.name = name
+        self.match = match
+        self.shape1 = shape1
+        self.shape2 = shape2
+        self.n_mismatch = n_mismatch
+        self.size = size
+        self.max_error = max_error
+        self.avg_error = avg_error
+        self.std_error = std_error
+        # [(index, d1, d2, error)] of the largest errors
+        self.top = top or []
+        # [(start, stop)] along each axis, the bounding hyperslab of the mismatches
+        self.region = region
+
+    @classmethod
+    def from_stat(cls, name, match, shape1, shape2, stat=None):
+        # stat is the ErrorStat, or None if the data matches
+        if stat is None:
+            size = None
+            if shape1 is not None and shape1 == shape2:
+                size = 1
+                for n in shape1:
+                    size *= n
+            return cls(name, match, shape1, shape2, 0 if match else None, size)
+        result = cls(name, match, shape1, shape2, stat.n_mismatch, stat.count,
+                     top=[(w, v1, v2, err) for _, err, w, v1, v2 in stat.top],
+                     region=stat.region)
+        if stat.numeric:
+            result.max_error = float(stat.err.max)
+            result.avg_error = float(stat.err.avg)
+            result.std_error = float(stat.err.std)
+        return result
+
+    def to_dict(self):
+        return {k: _plain(v) for k, v in self.__dict__.items()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def __repr__(self):
+        return f'VariableResult({self.name!r}, match={self.match}, n_mismatch={self.n_mismatch})'
+
+
+class FileResult:
+    # the comparison result of one file pair
+    def __init__(self, file1, file2, match, match_attr=None, variables=None):
+        self.file1 = file1
+        self.file2 = file2
+        self.match = match
+        self.match_attr = match_attr
+        self.variables = variables or []
+
+    def to_dict(self):
+        return {'file1': self.file1, 'file2': self.file2, 'match': self.match,
+                'match_attr': self.match_attr,
+                'variables': [v.to_dict() for v in self.variables]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['file1'], d['file2'], d['match'], d.get('match_attr'),
+                   [VariableResult.from_dict(v) for v in d.get('variables', [])])
+
+    @property
+    def mismatched(self):
+        return [v for v in self.variables if not v.match]
+
+    def __repr__(self):
+        return (f'FileResult({self.file1!r}, {self.file2!r}, match={self.match}, '
+                f'match_attr={self.match_attr}, {len(self.mismatched)}/{len(self.variables)} variables mismatched)')
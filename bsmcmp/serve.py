@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import socket
+import threading
+import tempfile
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+import click
+
+
+def default_socket():
+    folder = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(folder, f'bsmcmp-{os.getuid()}.sock')
+
+
+def _warm(formats):
+    # import the format modules (netCDF4, h5py, ...) once per worker process
+    from .api import get_test_class
+    for fmt in formats:
+        try:
+            get_test_class(fmt)
+        except ImportError:
+            pass
+
+
+def _compare(file1, file2, fmt, opts):
+    # run in the worker process, return a json-able dict
+    from .api import compare_files
+    return compare_files(file1, file2, fmt, **opts).to_dict()
+
+
+def _send(fp, msg):
+    fp.write(json.dumps(msg).encode() + b'\n')
+    fp.flush()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    # one json object per line:
+    #   request: {"file1": ..., "file2": ..., "format": ..., "options": {...}}
+    #   reply: {"result": {...}} or {"error": "..."}
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                if job.get('command') == 'shutdown':
+                    _send(self.wfile, {'result': 'shutdown'})
+                    # shutdown() waits for serve_forever() to return
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+                # the paths are resolved by the client
+                future = self.server.executor.submit(_compare, job['file1'], job['file2'],
+                                                     job.get('format'), job.get('options') or {})
+                _send(self.wfile, {'result': future.result()})
+            except Exception as e:
+                _send(self.wfile, {'error': f'{type(e).__name__}: {e}'})
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, address, executor):
+        self.executor = executor
+        super().__init__(address, Handler)
+
+
+@click.command('serve', context_settings={'show_default': True})
+@click.option('--socket', 'address', default=default_socket(), type=click.Path(), help='the Unix socket to listen on')
+@click.option('--workers', default=os.cpu_count(), type=int, help='# of the worker processes')
+@click.option('--format', 'formats', multiple=True, help='the formats to preload, default all')
+def serve(address, workers, formats):
+    """Keep warm worker processes, and run the comparisons submitted by "bsmcmp submit"."""
+    from .api import FORMATS
+    if os.path.exists(address):
+        # remove the stale socket
+        try:
+            with socket.socket(socket.AF_UNIX) as s:
+                s.connect(address)
+            raise click.ClickException(f'"{address}" is in use')
+        except ConnectionRefusedError:
+            os.unlink(address)
+    formats = formats or list(FORMATS)
+    with ProcessPoolExecutor(workers, initializer=_warm, initargs=(formats,)) as executor:
+        # start the workers now, so the first job does not pay the imports
+        for f in [executor.submit(abs, 0) for _ in range(workers)]:
+            f.result()
+        with Server(address, executor) as server:
+            click.echo(f'listening on {address} with {workers} workers')
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(address)
+
+
+# the options taking multiple values, which are always sent as lists
+MULTIPLE_OPTIONS = ('ignore_var', 'ignore_attr', 'ignore_pattern', 'percentile')
+
+
+def _option(ctx, param, value):
+    # key=value, the value is parsed as json if possible, e.g., top_k=10
+    opts = {}
+    for v in value:
+        key, sep, v = v.partition('=')
+        if not sep:
+            raise click.BadParameter(f'expect key=value, got "{key}"')
+        try:
+            v = json.loads(v)
+        except ValueError:
+            pass
+        if key in MULTIPLE_OPTIONS:
+            opts.setdefault(key, []).extend(v if isinstance(v, list) else [v])
+        elif key in opts:
+            if not isinstance(opts[key], list):
+                opts[key] = [opts[key]]
+            opts[key].append(v)
+        else:
+            opts[key] = v
+    return opts
+
+
+@click.command('submit', context_settings={'show_default': True})
+@click.option('--socket', 'address', default=default_socket(), type=click.Path(), help='the Unix socket of "bsmcmp serve"')
+@click.option('--file1', type=click.Path(exists=True, resolve_path=True), help='file 1')
+@click.option('--file2', type=click.Path(exists=True, resolve_path=True), help='file 2')
+@click.option('--format', 'fmt', default=None, help='the file format, default from the file extension')
+@click.option('-o', '--option', 'options', multiple=True, callback=_option, help='comparison option, e.g., -o ignore_var=time')
+@click.option('--json', 'as_json', is_flag=True, help='print the result as json')
+@click.option('--shutdown', is_flag=True, help='stop the server')
+def submit(address, file1, file2, fmt, options, as_json, shutdown):
+    """Submit a comparison to "bsmcmp serve"."""
+    if shutdown:
+        job = {'command': 'shutdown'}
+    elif file1 and file2:
+        job = {'file1': file1, 'file2': file2, 'format': fmt, 'options': options}
+    else:
+        raise click.UsageError('both --file1 and --file2 are required')
+    try:
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(address)
+            with s.makefile('rwb') as fp:
+                _send(fp, job)
+                reply = json.loads(fp.readline())
+    except (FileNotFoundError, ConnectionRefusedError):
+        raise click.ClickException(f'no server at "{address}", start it with "bsmcmp serve"')
+
+    if 'error' in reply:
+        raise click.ClickException(reply['error'])
+    result = reply['result']
+    if shutdown:
+        return
+    if as_json:
+        click.echo(json.dumps(result))
+    else:
+        for v in result['variables']:
+            if not v['match']:
+                click.secho(f"{v['name']}: fail", fg='red')
+        if result['match'] and result['match_attr'] is not False:
+            click.secho('pass', fg='green')
+        else:
+            click.secho('fail', fg='red')
+    match = result['match'] and result['match_attr'] is not False
+    sys.exit(0 if match else 1)
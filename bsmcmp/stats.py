@@ -0,0 +1,292 @@
+import hashlib
+import numpy as np
+
+from . import kernels
+
+
+class StreamStat:
+    # single pass statistics of the data fed block by block; the mean/variance
+    # of each block is merged with Chan's parallel algorithm, and the
+    # percentiles are estimated from a uniform (reservoir) sample
+    SAMPLE_SIZE = 100000
+
+    def __init__(self, checksum=False, sample_size=0, seed=0):
+        self.count = 0
+        self.n_nan = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sum = 0.0
+        self.min = np.nan
+        self.max = np.nan
+        self.dtype = None
+        self.numeric = True
+        self._hash = hashlib.blake2b(digest_size=16) if checksum else None
+        self._sample_size = sample_size
+        self._sample = None
+        self._sample_count = 0
+        self._rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def canonical_dtype(dtype):
+        # little-endian, and float64 for floating point data, so the checksum
+        # does not depend on how the data is read (e.g., memory-mapped or not)
+        if dtype.kind == 'f':
+            return np.dtype('<f8')
+        return dtype.newbyteorder('<')
+
+    def update(self, block):
+        block = np.asarray(block)
+        if self.dtype is None:
+            self.dtype = self.canonical_dtype(block.dtype)
+            self.numeric = block.dtype.kind in 'biuf'
+        if self._hash is not None:
+            if block.dtype.kind in 'OUS':
+                self._hash_elements(block)
+            else:
+                self._hash.update(np.ascontiguousarray(block, dtype=self.dtype).tobytes())
+        block = block.ravel()
+        self.count += block.size
+        if not self.numeric or block.size == 0:
+            return
+
+        if block.dtype.kind == 'f':
+            nan = np.isnan(block)
+            n_nan = int(np.count_nonzero(nan))
+            if n_nan:
+                self.n_nan += n_nan
+                block = block[~nan]
+        n = block.size
+        if n == 0:
+            return
+
+        mean = float(np.mean(block, dtype=np.float64))
+        dev = np.subtract(block, mean, dtype=np.float64)
+        m2 = float(np.dot(dev, dev))
+        self.merge(n, mean, m2, float(np.min(block)), float(np.max(block)))
+        self._update_sample(block)
+
+    def _hash_elements(self, block):
+        # the UTF-8 bytes of each element with its length, instead of the
+        # object pointers (e.g., the variable-length strings of HDF5)
+        for v in block.ravel():
+            if isinstance(v, np.ndarray):
+                v = v.tobytes()
+            elif not isinstance(v, (bytes, np.bytes_)):
+                v = str(v).encode('utf-8')
+            self._hash.update(len(v).to_bytes(8, 'little'))
+            self._hash.update(v)
+
+    def merge(self, n, mean, m2, bmin, bmax):
+        # merge the mean/m2/min/max of n (not nan) elements
+        if n == 0:
+            return
+        if self.n == 0:
+            self.mean, self.m2, self.min, self.max = mean, m2, bmin, bmax
+        else:
+            total = self.n + n
+            delta = mean - self.mean
+            self.mean += delta * n / total
+            self.m2 += m2 + delta * delta * self.n * n / total
+            self.min = min(self.min, bmin)
+            self.max = max(self.max, bmax)
+        self.n += n
+        self.sum += mean * n
+
+    def update_constant(self, value, n):
+        # same as update() with n elements of value, without the array
+        # (no sample or checksum)
+        if n <= 0:
+            return
+        self.count += n
+        if self.dtype is None:
+            self.dtype = np.dtype('<f8')
+        value = float(value)
+        self.merge(n, value, 0.0, value, value)
+
+    def _update_sample(self, block):
+        k = self._sample_size
+        if k <= 0:
+            return
+        if self._sample is None:
+            self._sample = np.empty(k, dtype=np.float64)
+        filled = min(self._sample_count, k)
+        head = min(k - filled, block.size)
+        if head > 0:
+            self._sample[filled:filled+head] = block[:head]
+        rest = block[head:]
+        if rest.size:
+            # reservoir sampling (algorithm R), the t-th element replaces a
+            # random item with probability k/t
+            t = np.arange(self._sample_count + head + 1, self._sample_count + block.size + 1)
+            r = (self._rng.random(rest.size) * t).astype(np.int64)
+            keep = r < k
+            self._sample[r[keep]] = rest[keep]
+        self._sample_count += block.size
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.n) if self.n else np.nan
+
+    @property
+    def avg(self):
+        return self.mean if self.n else np.nan
+
+    @property
+    def checksum(self):
+        return self._hash.hexdigest() if self._hash is not None else None
+
+    @property
+    def sample(self):
+        if self._sample is None:
+            return np.empty(0)
+        return self._sample[:min(self._sample_count, self._sample_size)]
+
+    def percentile(self, q):
+        sample = self.sample
+        if sample.size == 0:
+            return np.full(np.shape(q), np.nan)
+        return np.percentile(sample, q)
+
+    def histogram(self, bins):
+        sample = self.sample
+        if sample.size == 0:
+            return np.zeros(bins, dtype=np.int64)
+        hist, _ = np.histogram(sample, bins=bins, range=(self.min, self.max))
+        return hist
+
+
+class ErrorStat:
+    # statistics of the difference between two arrays fed block by block,
+    # without any full-size index array: the top-k largest errors, the
+    # bounding hyperslab of the mismatches, and the # of mismatches along
+    # each axis
+    MAX_AXIS_COUNT = 1000000
+    # elements of each sub-block to select the top-k errors
+    TOP_BLOCK = 1024*1024
+
+    def __init__(self, shape, top_k=5, diff=None):
+        self.shape = tuple(shape)
+        self.top_k = top_k
+        # DiffVariable to save the mismatched elements
+        self.diff = diff
+        self.count = 0
+        self.n_mismatch = 0
+        self.n_zero = 0
+        self.numeric = True
+        self.err = StreamStat()
+        # (rank, err, index, v1, v2) of the largest errors
+        self.top = []
+        self.lower = [None]*len(self.shape)
+        self.upper = [None]*len(self.shape)
+        self.axis_count = [np.zeros(n, dtype=np.int64) if n <= self.MAX_AXIS_COUNT else None
+                           for n in self.shape]
+
+    def update(self, a, b, offset=None, mismatched=False):
+        # mismatched: a and b are known to be different (e.g., compared
+        # already), so the one-pass kernel, which only saves the time of the
+        # matched blocks, is skipped
+        a = np.asarray(a)
+        b = np.asarray(b)
+        if offset is None:
+            offset = (0,)*a.ndim
+        self.count += a.size
+        self.numeric = np.issubdtype(a.dtype, np.number) and np.issubdtype(b.dtype, np.number)
+        # the error statistics in one pass (if numba is available), and the
+        # arrays below are only needed if there is any mismatch
+        stats = kernels.error_stats(a, b) if self.numeric and not mismatched else None
+        if stats is not None:
+            self.err.count += a.size
+            self.err.n_nan += stats['n_nan']
+            self.err.merge(stats['n'], stats['mean'], stats['m2'], stats['min'], stats['max'])
+            self.n_zero += stats['n_zero']
+            if stats['n_mismatch'] == 0:
+                return
+
+        mismatch = a != b
+        if np.issubdtype(a.dtype, np.inexact) and np.issubdtype(b.dtype, np.inexact):
+            mismatch &= ~(np.isnan(a) & np.isnan(b))
+        n_mismatch = stats['n_mismatch'] if stats is not None else int(np.count_nonzero(mismatch))
+        self.n_mismatch += n_mismatch
+
+        err = None
+        if self.numeric:
+            if a.dtype.kind in 'ub' or b.dtype.kind in 'ub':
+                # avoid the overflow of the unsigned integers
+                err = np.abs(np.subtract(a, b, dtype=np.float64))
+            else:
+                err = np.abs(a - b)
+            if stats is None:
+                self.err.update(err)
+                self.n_zero += int(np.count_nonzero(err == 0))
+
+        if n_mismatch == 0 or a.ndim == 0:
+            return
+
+        if self.diff is not None:
+            self.diff.write(mismatch, a, b, err, offset)
+
+        # top-k, only among the mismatched elements; sub-block by sub-block,
+        # so no index or key array of the full size is needed
+        flat_mismatch = mismatch.reshape(-1)
+        flat_err = err.reshape(-1) if err is not None else None
+        for start in range(0, flat_mismatch.size, self.TOP_BLOCK):
+            m = flat_mismatch[start:start + self.TOP_BLOCK]
+            if not m.any():
+                continue
+            if flat_err is not None:
+                # the error is nan if only one side is nan, put it on top
+                key = np.nan_to_num(flat_err[start:start + self.TOP_BLOCK], nan=np.inf)
+                key = np.where(m, key, -np.inf)
+                k = min(self.top_k, key.size)
+                idx = np.argpartition(key, key.size - k)[key.size - k:]
+                idx = idx[key[idx] > -np.inf]
+            else:
+                key = None
+                idx = np.flatnonzero(m)[:self.top_k]
+            for i in idx:
+                w = np.unravel_index(start + i, a.shape)
+                e = err[w] if err is not None else None
+                rank = key[i] if key is not None else 1
+                self.top.append((rank, e, tuple(int(o + j) for o, j in zip(offset, w)), a[w], b[w]))
+            self.top.sort(key=lambda t: t[0], reverse=True)
+            del self.top[self.top_k:]
+
+        # bounding hyperslab and # of mismatches along each axis
+        for axis in range(a.ndim):
+            others = tuple(i for i in range(a.ndim) if i != axis)
+            count = np.count_nonzero(mismatch, axis=others) if others else mismatch.astype(np.int64)
+            nz = np.flatnonzero(count)
+            lo, hi = offset[axis] + nz[0], offset[axis] + nz[-1] + 1
+            self.lower[axis] = lo if self.lower[axis] is None else min(self.lower[axis], lo)
+            self.upper[axis] = hi if self.upper[axis] is None else max(self.upper[axis], hi)
+            if self.axis_count[axis] is not None:
+                self.axis_count[axis][offset[axis]:offset[axis] + count.size] += count
+
+    def add_equal(self, n):
+        # n elements known to be equal (e.g., identical chunks), which are
+        # counted without being compared
+        self.count += n
+        if self.numeric:
+            self.err.update_constant(0, n)
+            self.n_zero += n
+
+    @property
+    def match(self):
+        return self.n_mismatch == 0
+
+    @property
+    def region(self):
+        return [(int(lo), int(hi)) for lo, hi in zip(self.lower, self.upper) if lo is not None]
+
+
+def wilson_interval(k, n, z=1.96):
+    # confidence interval of the proportion k/n (Wilson score), which is still
+    # meaningful when k is 0 or n
+    if n <= 0:
+        return 0.0, 1.0
+    p = k / n
+    denom = 1 + z*z/n
+    center = (p + z*z/(2*n)) / denom
+    half = z*np.sqrt(p*(1 - p)/n + z*z/(4*n*n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
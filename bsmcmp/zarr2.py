@@ -0,0 +1,355 @@
+import os
+import json
+import numpy as np
+import numcodecs
+from numcodecs.compat import ensure_ndarray
+
+from .base import TestBaseAttr, get_executor, NUM_THREADS
+from .stats import ErrorStat
+
+
+def _load_json(filename):
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename, 'r', encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def is_store(path):
+    return any(os.path.isfile(os.path.join(path, f)) for f in ('.zgroup', '.zarray'))
+
+
+def open_store(path):
+    if os.path.isfile(os.path.join(path, '.zarray')):
+        return ZarrArray(path)
+    return ZarrGroup(path)
+
+
+class ZarrGroup:
+    # a group in Zarr v2 directory store
+    def __init__(self, path):
+        self.path = path
+        self.attrs = _load_json(os.path.join(path, '.zattrs'))
+
+    def keys(self):
+        return sorted(k for k in os.listdir(self.path)
+                      if not k.startswith('.') and is_store(os.path.join(self.path, k)))
+
+    def items(self):
+        for k in self.keys():
+            yield k, self[k]
+
+    def __getitem__(self, key):
+        return open_store(os.path.join(self.path, key))
+
+    def __contains__(self, key):
+        return is_store(os.path.join(self.path, key))
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class ZarrArray:
+    # an array in Zarr v2 directory store, the chunks are read and decoded
+    # with numcodecs when being sliced
+    def __init__(self, path):
+        self.path = path
+        self.meta = _load_json(os.path.join(path, '.zarray'))
+        self.attrs = _load_json(os.path.join(path, '.zattrs'))
+        self.shape = tuple(self.meta['shape'])
+        self.chunks = tuple(self.meta['chunks'])
+        dtype = self.meta['dtype']
+        self.dtype = np.dtype([tuple(f) for f in dtype] if isinstance(dtype, list) else dtype)
+        self.order = self.meta.get('order', 'C')
+        self.separator = self.meta.get('dimension_separator', '.')
+        compressor = self.meta.get('compressor')
+        self.compressor = numcodecs.get_codec(compressor) if compressor else None
+        self.filters = [numcodecs.get_codec(f) for f in self.meta.get('filters') or []]
+
+    @property
+    def fill_value(self):
+        v = self.meta.get('fill_value')
+        if v is None:
+            return None
+        if isinstance(v, str) and v in ('NaN', 'Infinity', '-Infinity'):
+            return {'NaN': np.nan, 'Infinity': np.inf, '-Infinity': -np.inf}[v]
+        return v
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def grid(self):
+        return tuple(-(-n // c) for n, c in zip(self.shape, self.chunks))
+
+    def codecs(self):
+        # the chunks are stored in the same bytes if the codecs are the same
+        return (self.dtype, self.chunks, self.order, self.meta.get('fill_value'),
+                self.meta.get('compressor'), self.meta.get('filters'))
+
+    def chunk_file(self, index):
+        key = self.separator.join(map(str, index)) if index else '0'
+        return os.path.join(self.path, key)
+
+    def read_chunk(self, index):
+        # the raw (encoded) bytes of the chunk, or None if not written
+        try:
+            with open(self.chunk_file(index), 'rb') as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return None
+
+    def chunk_slice(self, index):
+        return tuple(slice(i*c, min((i + 1)*c, n)) for i, c, n in zip(index, self.chunks, self.shape))
+
+    def decode_chunk(self, index, raw=None):
+        # the chunk data, cropped to the array bounds
+        if raw is None:
+            raw = self.read_chunk(index)
+        shape = tuple(s.stop - s.start for s in self.chunk_slice(index))
+        if raw is None:
+            fill = self.fill_value
+            return np.full(shape, 0 if fill is None else fill, dtype=self.dtype)
+        if self.compressor is not None:
+            raw = self.compressor.decode(raw)
+        for f in reversed(self.filters):
+            raw = f.decode(raw)
+        if isinstance(raw, np.ndarray) and raw.dtype == object:
+            data = raw
+        else:
+            data = ensure_ndarray(raw).view(self.dtype)
+        data = data.reshape(self.chunks, order=self.order)
+        return data[tuple(slice(0, n) for n in shape)]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            key = ()
+        key = key + (slice(None),)*(len(self.shape) - len(key))
+        sel = [slice(*k.indices(n)[:2]) for k, n in zip(key, self.shape)]
+        out = np.empty(tuple(max(0, s.stop - s.start) for s in sel), dtype=self.dtype)
+        if out.size == 0:
+            return out
+        ranges = [range(s.start // c, -(-s.stop // c)) for s, c in zip(sel, self.chunks)]
+        for index in np.ndindex(*[len(r) for r in ranges]):
+            index = tuple(r[i] for r, i in zip(ranges, index))
+            chunk = self.decode_chunk(index)
+            src, dst = [], []
+            for s, cs in zip(sel, self.chunk_slice(index)):
+                lo, hi = max(s.start, cs.start), min(s.stop, cs.stop)
+                src.append(slice(lo - cs.start, hi - cs.start))
+                dst.append(slice(lo - s.start, hi - s.start))
+            out[tuple(dst)] = chunk[tuple(src)]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[()]
+        return data if dtype is None else data.astype(dtype)
+
+
+class TestZarr(TestBaseAttr):
+    NAME = 'Zarr'
+    EXT = '.zarr'
+    DIR_OK = True
+
+    def is_file(self, filename):
+        return os.path.isdir(filename) and is_store(filename)
+
+    @staticmethod
+    def get_signature(*files):
+        # the mtime of the store directory doesn't change when a chunk is
+        # rewritten, so the latest mtime, # of files and total size of
+        # everything in the store
+        sig = []
+        for file in files:
+            mtime, count, size = None, 0, 0
+            for root, _, names in os.walk(file):
+                for name in names:
+                    try:
+                        st = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    mtime = st.st_mtime_ns if mtime is None else max(mtime, st.st_mtime_ns)
+                    count += 1
+                    size += st.st_size
+            sig += [mtime, count, size]
+        return sig
+
+    def get_pairs(self, folder1, folder2):
+        # each store is one "file", don't look into it
+        for root, dirs, _ in os.walk(folder1):
+            for k in sorted(dirs):
+                filename = os.path.join(root, k)
+                if not (k.endswith(self.ext) and is_store(filename)):
+                    continue
+                if self.shall_ignore(filename):
+                    continue
+                file_rel = os.path.relpath(filename, folder1).replace(os.sep, '/')
+                if not self.in_shard(file_rel):
+                    continue
+                yield filename, os.path.join(folder2, file_rel), file_rel
+            if not self.recursive:
+                break
+            dirs[:] = [k for k in dirs if not is_store(os.path.join(root, k))]
+
+    def get_attrs(self, d):
+        return d.attrs
+
+    def get_data(self, d):
+        return np.asarray(d)
+
+    def get_schema(self, d):
+        if not isinstance(d, ZarrArray):
+            return super().get_schema(d)
+        return {'dtype': str(d.dtype), 'shape': d.shape, 'chunks': d.chunks,
+                'order': d.order, 'compressor': d.meta.get('compressor'),
+                'filters': d.meta.get('filters'), 'fill_value': d.meta.get('fill_value')}
+
+    def compare_chunk(self, d1, d2, index, same_codecs):
+        # return (None, n) if the chunk (of n elements) is the same, otherwise
+        # (a, b) the decoded data
+        raw1, raw2 = d1.read_chunk(index), d2.read_chunk(index)
+        if same_codecs and raw1 == raw2:
+            # also true if neither is written
+            shape = [s.stop - s.start for s in d1.chunk_slice(index)]
+            return None, int(np.prod(shape, dtype=np.int64))
+        a, b = d1.decode_chunk(index, raw1), d2.decode_chunk(index, raw2)
+        if np.array_equal(a, b, equal_nan=np.issubdtype(a.dtype, np.number)):
+            return None, a.size
+        return a, b
+
+    def check_data(self, d1, d2, indent='', name=None):
+        if self.structure_only or self.sample or not isinstance(d1, ZarrArray) or \
+           not isinstance(d2, ZarrArray) or d1.shape != d2.shape or \
+           d1.chunks != d2.chunks or not d1.shape:
+            return super().check_data(d1, d2, indent, name)
+        return self.check_chunks(d1, d2, indent, name)
+
+    def check_chunks(self, d1, d2, indent='', name=None):
+        # compare the arrays chunk by chunk; the chunk files are compared
+        # first if the codecs are the same, and only the different ones are
+        # decoded, in the thread pool
+        same_codecs = d1.codecs() == d2.codecs()
+        stat = ErrorStat(d1.shape, self.top_k, self.get_diff(name, d1.shape))
+        executor = get_executor()
+        # limit the decoded chunks in memory
+        window = 2*NUM_THREADS
+        if self.max_memory > 0:
+            chunk = int(np.prod(d1.chunks, dtype=np.int64))*(d1.dtype.itemsize + d2.dtype.itemsize + 26)
+            window = max(1, min(window, self.max_memory*1024*1024 // chunk))
+        pending = []
+
+        def _collect(future, index):
+            a, b = future.result()
+            if a is None:
+                stat.add_equal(b)
+            else:
+                stat.update(a, b, [s.start for s in d1.chunk_slice(index)])
+
+        for index in np.ndindex(*d1.grid):
+            pending.append((executor.submit(self.compare_chunk, d1, d2, index, same_codecs), index))
+            if len(pending) >= window:
+                _collect(*pending.pop(0))
+        for p in pending:
+            _collect(*p)
+        return self.show_stat(stat, indent, name)
+
+    def check_group(self, group1, group2, indent="", path=""):
+
+        # check attribute
+        match_attr = self.check_attr(group1, group2)
+
+        # check data and its attributes
+        match_data = len(group1) == len(group2)
+        for k, v in group1.items():
+            self.start_message_delay()
+
+            self.error(k, fg=None)
+            if self.has_pattern(k, self.ignore_variables):
+                self.warning(f"{indent}    ignore")
+                self.end_message_delay()
+                continue
+
+            if k not in group2:
+                self.error(f'{indent}    not found in 2nd file')
+                match_data = False
+                self.end_message_delay()
+                continue
+
+            d2 = group2[k]
+            name = f'{path}/{k}'
+            if isinstance(v, ZarrGroup) and isinstance(d2, ZarrGroup):
+                m_data, m_attr = self.check_group(v, d2, indent + '    ', name)
+                match_data = match_data and m_data
+                match_attr = match_attr and m_attr
+            elif isinstance(v, ZarrArray) and isinstance(d2, ZarrArray):
+                if not self.check_data(v, d2, indent+'    ', name):
+                    match_data = False
+
+                if not self.check_attr(v, d2, indent+'    '):
+                    match_attr = False
+            else:
+                self.error(f'{indent}    different type: {type(v).__name__} / {type(d2).__name__}')
+                match_data = False
+
+            self.end_message_delay()
+
+        for k in group2.keys():
+            if k not in group1:
+                self.error(k, fg=None)
+                self.error(f'{indent}    not found in 1st file')
+                match_data = False
+
+        return match_data, match_attr
+
+    def do_test(self, file1, file2):
+        f1 = open_store(file1)
+        f2 = open_store(file2)
+        if isinstance(f1, ZarrArray) and isinstance(f2, ZarrArray):
+            match_data = self.check_data(f1, f2, '    ', '/')
+            match_attr = self.check_attr(f1, f2, '    ')
+            return match_data, match_attr
+        if isinstance(f1, ZarrGroup) and isinstance(f2, ZarrGroup):
+            return self.check_group(f1, f2)
+        self.error(f'different type: {type(f1).__name__} / {type(f2).__name__}')
+        return False, self.check_attr(f1, f2)
+
+    def stat_group(self, group1, indent="", path=""):
+
+        # check attribute
+        self.stat_attr(group1)
+
+        # check data and its attributes
+        for k, v in group1.items():
+            self.start_message_delay()
+
+            self.error(k, fg=None)
+            if self.has_pattern(k, self.ignore_variables):
+                self.warning(f"{indent}    ignore")
+                self.end_message_delay()
+                continue
+
+            name = f'{path}/{k}'
+            if isinstance(v, ZarrGroup):
+                self.stat_group(v, indent + '    ', name)
+            else:
+                self.stat_data(v, indent+'    ', name)
+
+                self.stat_attr(v, indent+'    ')
+
+            self.end_message_delay()
+
+    def do_stat(self, file):
+        f1 = open_store(file)
+        if isinstance(f1, ZarrArray):
+            self.stat_data(f1, '    ', '/')
+            self.stat_attr(f1, '    ')
+        else:
+            self.stat_group(f1)
+
+
+@TestZarr.click_command()
+def test_zarr(**kwargs):
+    TestZarr.run(**kwargs)